@@ -1,39 +1,42 @@
 from __future__ import annotations
 
-import base64
 import datetime
 import json
 import logging
+import threading
 from functools import cached_property
 from time import time
 from typing import TYPE_CHECKING
 
 import requests
 import rsa
-from bs4 import BeautifulSoup
 
 from . import cache
-from .datatypes import TradeConfirmation
+from .datatypes import SteamURL, TradeConfirmation
 from .exceptions import (
     RequestError,
     IncorrectPassword,
     LoginError,
-    CaptchaRequired,
-    EmailCodeRequired,
-    TwoFactorCodeInvalid,
     TradeError,
     CredentialsError,
 )
 from .utils import (
+    create_session,
     generate_session_id,
     do_no_cache,
     generate_one_time_code,
-    generate_device_id,
-    generate_confirmation_code,
+    generate_confirmation_params,
+    parse_rsa_key,
+    encrypt_password,
+    raise_for_login,
+    parse_api_key,
+    parse_trade_token,
+    trade_offer_payload,
+    parse_confirmations,
 )
 
 if TYPE_CHECKING:
-    from typing import Any
+    from typing import Any, Callable
     from .datatypes import ItemType, SessionData
 
 logger = logging.getLogger(__name__)
@@ -55,12 +58,16 @@ class Account:
         self._identity_secret: str | None = identity_secret
         self._logged_in: bool = False
         self._steam_id64: int | None = None
-        self._session = requests.Session()
-        self._session.headers["User-Agent"] = "python steam-inventory-manager/v1.0.0"
+        self._session = create_session()
         self._session_id: str | None = None
-        self._public_key, self._timestamp = self._rsa_key()
+        self._session_timestamp: int | None = None
+        self._public_key: rsa.PublicKey | None = None
+        self._timestamp: datetime.datetime | None = None
         self._priorities: list[ItemType] = priorities or []
         self._confirmations: dict[int, TradeConfirmation] = {}
+        # held while the session is used for a trade, and while it's replaced by a login.
+        # otherwise a background refresh could swap the session id and cookies in the middle of a trade.
+        self._lock = threading.RLock()
 
     def __repr__(self):
         return (
@@ -107,7 +114,12 @@ class Account:
 
     @property
     def session_id(self) -> str:
-        return self._shared_secret
+        return self._session_id
+
+    @property
+    def session_timestamp(self) -> int | None:
+        """Unix time of the login that created the current session"""
+        return self._session_timestamp
 
     @property
     def public_key(self) -> rsa.PublicKey:
@@ -121,99 +133,159 @@ class Account:
     def priorities(self) -> list[ItemType]:
         return self._priorities
 
+    @priorities.setter
+    def priorities(self, new_priorities: list[ItemType]):
+        self._priorities = new_priorities
+
     @property
     def encrypted_password(self):
-        return base64.b64encode(rsa.encrypt(self.password.encode("utf8"), self.public_key)).decode("utf8")
+        return encrypt_password(self.password, self.public_key)
 
     @cached_property
     def trade_token(self):
-        privacy_page = self.session.get(f"https://steamcommunity.com/profiles/{self.steam_id64}/tradeoffers/privacy")
-        soup = BeautifulSoup(privacy_page.text, "html.parser")
-        trade_link = soup.find("input", {"id": "trade_offer_access_url"}).attrs["value"]
-        return trade_link.split("&token=")[-1]
-
-    def trade(self, partner: Account, me: list = None, them: list = None) -> int:
-        """Sends a trade an returns the trade id"""
-        payload = {
-            "sessionid": self.session_id,
-            "serverid": 1,
-            "partner": partner.steam_id64,
-            "tradeoffermessage": f"Trade created by steam-inventory-manager on {datetime.datetime.now():%x at %X}",
-            "json_tradeoffer": json.dumps(
-                {
-                    "newversion": "true",
-                    "version": 2,
-                    "me": {"assets": me or [], "currency": [], "ready": "false"},
-                    "them": {"assets": them or [], "currency": [], "ready": "false"},
-                }
-            ),
-            "captcha": "",
-            "trade_offer_create_params": json.dumps({"trade_offer_access_token": partner.trade_token}),
+        privacy_page = self.session.get(f"{SteamURL.COMMUNITY}/profiles/{self.steam_id64}/tradeoffers/privacy")
+        return parse_trade_token(privacy_page.text)
+
+    @cached_property
+    def api_key(self):
+        apikey_page = self.session.get(f"{SteamURL.COMMUNITY}/dev/apikey")
+        api_key = parse_api_key(apikey_page.text)
+        if not api_key:
+            raise CredentialsError(f"no steam web api key is registered for {self.username}")
+        return api_key
+
+    def trade_offers(self, time_historical_cutoff: int, *, active_only: bool = True) -> list[dict]:
+        """
+        Returns the trade offers sent by this account in one paginated listing instead of a request per offer.
+        With `active_only`, only active offers and offers updated since `time_historical_cutoff` are included.
+        """
+        params = {
+            "key": self.api_key,
+            "get_sent_offers": 1,
+            "get_received_offers": 0,
+            "get_descriptions": 0,
+            "active_only": int(active_only),
+            "time_historical_cutoff": time_historical_cutoff,
+            "cursor": 0,
         }
-        headers = {"Referer": "https://steamcommunity.com/tradeoffer/new/"}
-        tradeoffer = self.session.post(
-            "https://steamcommunity.com/tradeoffer/new/send", data=payload, headers=headers
-        ).json()
+        offers: list[dict] = []
+        while True:
+            try:
+                resp = self.session.get(
+                    f"{SteamURL.API}/IEconService/GetTradeOffers/v1/", params=params, timeout=15
+                ).json()["response"]
+            except requests.exceptions.RequestException as e:
+                raise RequestError(str(e))
+            offers.extend(resp.get("trade_offers_sent", []))
+            if not resp.get("next_cursor"):
+                return offers
+            params["cursor"] = resp["next_cursor"]
+
+    def trade(
+        self,
+        partner: Account,
+        me: list = None,
+        them: list = None,
+        on_sent: Callable[[int], None] | None = None,
+        *,
+        confirm: bool = True,
+    ) -> int:
+        """
+        Sends a trade an returns the trade id.
+        `on_sent` is called with the trade id once the offer exists, before it's confirmed.
+        Without `confirm`, the offer is left for `confirm_trade`.
+        """
+        trade_token = partner.trade_token
+        with self._lock:
+            payload = trade_offer_payload(self.session_id, partner.steam_id64, trade_token, me, them)
+            headers = {"Referer": f"{SteamURL.COMMUNITY}/tradeoffer/new/"}
+            tradeoffer = self.session.post(
+                f"{SteamURL.COMMUNITY}/tradeoffer/new/send", data=payload, headers=headers
+            ).json()
 
-        if tradeoffer.get("strError"):
-            raise TradeError(tradeoffer["strError"])
+            if tradeoffer.get("strError"):
+                raise TradeError(tradeoffer["strError"])
 
-        trade_id = int(tradeoffer["tradeofferid"])
-        self._confirm_trade(trade_id, tradeoffer)
-        return trade_id
+            trade_id = int(tradeoffer["tradeofferid"])
+            if on_sent:
+                on_sent(trade_id)
+            if confirm:
+                self._confirm_trade(trade_id, tradeoffer)
+            return trade_id
 
     def accept_trade(self, partner: Account, trade_id: int):
-        payload = {
-            "sessionid": self.session_id,
-            "tradeofferid": trade_id,
-            "serverid": 1,
-            "partner": partner.steam_id64,
-            "captcha": "",
-        }
-        headers = {"Referer": f"https://steamcommunity.com/tradeoffer/{trade_id}"}
-        resp = self.session.post(
-            f"https://steamcommunity.com/tradeoffer/{trade_id}/accept", data=payload, headers=headers
-        ).json()
-        # confirmation shouldn't be needed as `needs_mobile_confirmation` will be False
-        # if no items are present of this account's side
-        self._confirm_trade(trade_id, resp)
-
-    def _confirm_trade(self, trade_id: int, tradeoffer_resp: dict):
-        if tradeoffer_resp.get("needs_mobile_confirmation", False):
-            self._fetch_confirmations()
-            confirmation = self._confirmations.get(trade_id)
-            timestamp = int(time())
-            device_id = generate_device_id(self.steam_id64)
-            params = {
-                "p": device_id,
-                "a": self.steam_id64,
-                "k": generate_confirmation_code(self.identity_secret, "allow", timestamp),
-                "t": timestamp,
-                "m": "android",
-                "tag": "allow",
-                "op": "allow",
-                "cid": confirmation.data_conf_id,
-                "ck": confirmation.data_key,
+        with self._lock:
+            payload = {
+                "sessionid": self.session_id,
+                "tradeofferid": trade_id,
+                "serverid": 1,
+                "partner": partner.steam_id64,
+                "captcha": "",
             }
-            resp = self.session.get("https://steamcommunity.com/mobileconf/ajaxop", params=params).json()
+            headers = {"Referer": f"{SteamURL.COMMUNITY}/tradeoffer/{trade_id}"}
+            resp = self.session.post(
+                f"{SteamURL.COMMUNITY}/tradeoffer/{trade_id}/accept", data=payload, headers=headers
+            ).json()
+            if resp.get("strError"):
+                raise TradeError(resp["strError"])
+            # confirmation shouldn't be needed as `needs_mobile_confirmation` will be False
+            # if no items are present of this account's side
+            self._confirm_trade(trade_id, resp)
+
+    def confirm_trade(self, trade_id: int) -> bool:
+        """
+        Confirms a trade with the mobile authenticator.
+        Returns False if there is no pending confirmation for the trade.
+        """
+        with self._lock:
+            self._fetch_confirmations()
+            confirmation = self._confirmations.pop(trade_id, None)
+            if not confirmation:
+                return False
+            params = self._create_confirmation_params("allow")
+            params["op"] = "allow"
+            params["cid"] = confirmation.data_conf_id
+            params["ck"] = confirmation.data_key
+            resp = self.session.get(f"{SteamURL.COMMUNITY}/mobileconf/ajaxop", params=params).json()
 
             if not resp.get("success", False):
                 raise TradeError("Failed to accept trade.")
+            return True
 
-    def login(self):
-        if self.logged_in:
+    def _confirm_trade(self, trade_id: int, tradeoffer_resp: dict):
+        if tradeoffer_resp.get("needs_mobile_confirmation", False) and not self.confirm_trade(trade_id):
+            raise TradeError(f"No confirmation found for trade {trade_id}.")
+
+    def login(self, code_generator: Callable[[], str] | None = None, *, force: bool = False):
+        """
+        Logs in, reusing the cached session when possible.
+
+        `code_generator` is only called when a full login is required and should return the Steam Guard code to use.
+        `force` skips the cached session and always performs a full login.
+        """
+        if self.logged_in and not force:
             return self.session
 
         logger.debug("Logging in...")
 
-        self._restore_session()
-        if self.logged_in:
-            return self.session
+        # only one process logs in to an account at a time. the others wait, then reuse the session it stored.
+        # trades on this account wait for the new session too.
+        with self._lock, cache.session_lock(self.username):
+            # when refreshing, a session stored by another process after ours was created is reused too
+            if self._restore_session(newer_than=self.session_timestamp if force else None):
+                return self.session
+            self._full_login(code_generator)
 
+    def _full_login(self, code_generator: Callable[[], str] | None):
         if not self.password:
             raise IncorrectPassword("password not specified")
 
-        attempt = self._attempt_login()
+        # fetched right before it's used, as the key is only valid for a short time.
+        # restored sessions don't need one at all.
+        self._public_key, self._timestamp = self._rsa_key()
+
+        one_time_code = code_generator() if code_generator else generate_one_time_code(self.shared_secret)
+        attempt = self._attempt_login(one_time_code)
 
         if attempt.get("success", False) and attempt.get("login_complete"):
 
@@ -227,38 +299,22 @@ class Account:
 
             self._session_id = generate_session_id()
             self._transfer_cookie("sessionid", self.session_id)
+            self._session_timestamp = int(time())
 
             transfer_parameters = attempt["transfer_parameters"]
             self._steam_id64 = transfer_parameters["steamid"]
             self._log_session()
             return
 
-        email_required = attempt.get("emailauth_needed", False)
-        captcha_required = attempt.get("captcha_needed", False)
-        two_factor_required = attempt.get("requires_twofactor", False)
-        password_incorrect = attempt.get("clear_password_field", False)
-        message = attempt["message"]
-
-        if captcha_required:
-            raise CaptchaRequired(message)
-        elif password_incorrect:
-            raise IncorrectPassword(message)
-        elif two_factor_required:
-            raise TwoFactorCodeInvalid(message)
-        elif email_required:
-            raise EmailCodeRequired("Email Authentication not supported.")
-        # sometimes the error message will match
-        # 'There have been too many login failures from your network in a short time period.'
-        # 'Please wait and try again later.'
-        raise LoginError(message)
-
-    def _attempt_login(self):
+        raise_for_login(attempt)
+
+    def _attempt_login(self, one_time_code: str):
         data = {
             "username": self.username,
             "password": self.encrypted_password,
             "emailauth": "",
             "emailsteamid": "",
-            "twofactorcode": generate_one_time_code(self.shared_secret),
+            "twofactorcode": one_time_code,
             "captchagid": -1,
             "captcha_text": "",
             "loginfriendlyname": self.session.headers["User-Agent"],
@@ -267,7 +323,7 @@ class Account:
             "donotcache": do_no_cache(),
         }
         try:
-            return self.session.post("https://steamcommunity.com/login/dologin/", data=data, timeout=15).json()
+            return self.session.post(f"{SteamURL.COMMUNITY}/login/dologin/", data=data, timeout=15).json()
         except requests.exceptions.RequestException as e:
             raise RequestError(str(e))
         except json.JSONDecodeError as e:
@@ -276,18 +332,13 @@ class Account:
     def _rsa_key(self) -> tuple[rsa.PublicKey, datetime.datetime]:
         try:
             resp = self.session.post(
-                "https://steamcommunity.com/login/getrsakey/",
+                f"{SteamURL.COMMUNITY}/login/getrsakey/",
                 timeout=15,
                 data={"username": self.username, "donotcache": do_no_cache()},
             ).json()
-            mod = int(resp["publickey_mod"], 16)
-            exp = int(resp["publickey_exp"], 16)
-            timestamp = resp["timestamp"]
-            return rsa.PublicKey(mod, exp), timestamp
         except requests.exceptions.RequestException as e:
             raise RequestError(str(e))
-        except KeyError:
-            raise LoginError("Unable to retrieve RSA keys from steam.")
+        return parse_rsa_key(resp)
 
     def _transfer_cookie(self, name: str, value: str):
         """sets a cookie for the three main steam domains"""
@@ -295,61 +346,52 @@ class Account:
             self.session.cookies.set(name, value, domain=domain, secure=True)
 
     def _create_confirmation_params(self, tag: str) -> dict[str, Any]:
-        timestamp = int(time())
-        return {
-            "p": generate_device_id(self.steam_id64),
-            "a": self.steam_id64,
-            "k": generate_confirmation_code(self.identity_secret, tag, timestamp),
-            "t": timestamp,
-            "m": "android",
-            "tag": tag,
-        }
+        return generate_confirmation_params(self.steam_id64, self.identity_secret, tag)
 
     def _fetch_confirmations(self):
         params = self._create_confirmation_params("conf")
         headers = {"X-Requested-With": "com.valvesoftware.android.steam.community"}
-        resp = self.session.get("https://steamcommunity.com/mobileconf/conf", params=params, headers=headers).text
-
-        if "incorrect Steam Guard codes." in resp:
-            raise CredentialsError("identity_secret is incorrect")
-        if "Oh nooooooes!" in resp:
-            raise TradeError("Failed to accept trade.")
-
-        soup = BeautifulSoup(resp, "html.parser")
-        if soup.select("#mobileconf_empty"):
-            return self._confirmations
-        for confirmation in soup.select("#mobileconf_list .mobileconf_list_entry"):
-            data_conf_id: int = int(confirmation["data-confid"])
-            data_key: str = confirmation["data-key"]
-            trade_id = int(confirmation["data-creator"])
-            confirmation_id: str = confirmation["id"].split("conf")[1]
-            self._confirmations[trade_id] = TradeConfirmation(confirmation_id, data_conf_id, data_key, trade_id)
+        resp = self.session.get(f"{SteamURL.COMMUNITY}/mobileconf/conf", params=params, headers=headers).text
+        self._confirmations.update(parse_confirmations(resp))
         return self._confirmations
 
+    def session_alive(self) -> bool:
+        """Checks with steam whether the current session is still logged in."""
+        steam_login_secure = self.session.cookies.get(name="steamLoginSecure", domain="steamcommunity.com")
+        if not self.session_id or not steam_login_secure:
+            return False
+        return self._test_login(self.session_id, steam_login_secure)
+
     @staticmethod
     def _test_login(session_id: str, steam_login_secure: str) -> bool:
         resp = requests.get(
-            "https://steamcommunity.com/my/profile",
+            f"{SteamURL.COMMUNITY}/my/profile",
             cookies={"sessionid": session_id, "steamLoginSecure": steam_login_secure},
         )
         # redirects to profile if logged in else brings you to login page
         return "login/home" not in resp.url
 
-    def _restore_session(self):
+    def _restore_session(self, newer_than: int | None = None) -> bool:
+        """Restores the cached session, if it works (and was created after `newer_than`)."""
         account_data = cache.session_data(self.username)
         if not account_data:
-            return
+            return False
+        if newer_than is not None and account_data.get("timestamp", 0) <= newer_than:
+            return False
         session_id = account_data["session_id"]
         steam_id64 = account_data["steam_id64"]
         steam_login_secure = account_data["steam_login_secure"]
         if not self._test_login(session_id, steam_login_secure):
             logger.debug("Failed to login with cached credentials.")
-            return
+            return False
         self._logged_in = True
         self._session_id = session_id
         self._steam_id64 = steam_id64
+        # sessions cached before timestamps were stored are treated as old
+        self._session_timestamp = account_data.get("timestamp", 0)
         self._transfer_cookie("sessionid", self.session_id)
         self._transfer_cookie(name="steamLoginSecure", value=steam_login_secure)
+        return True
 
     def _log_session(self):
         # this should always be set, but just in case, we don't want to set bad data in the json file.
@@ -359,5 +401,6 @@ class Account:
                 "session_id": self.session_id,
                 "steam_id64": self.steam_id64,
                 "steam_login_secure": steam_login_secure,
+                "timestamp": self.session_timestamp,
             }
             cache.store_session_data(self.username, session_data)
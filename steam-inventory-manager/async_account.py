@@ -0,0 +1,464 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+from time import time
+from typing import TYPE_CHECKING
+
+import aiohttp
+import rsa
+from yarl import URL
+
+from . import cache
+from .datatypes import SteamURL
+from .exceptions import (
+    RequestError,
+    IncorrectPassword,
+    LoginError,
+    TradeError,
+)
+from .utils import (
+    generate_session_id,
+    do_no_cache,
+    generate_one_time_code,
+    generate_confirmation_params,
+    parse_rsa_key,
+    encrypt_password,
+    raise_for_login,
+    parse_trade_token,
+    trade_offer_payload,
+    parse_confirmations,
+)
+
+if TYPE_CHECKING:
+    import datetime
+    from typing import Any, Awaitable, Callable
+    from .datatypes import ItemType, SessionData, TradeConfirmation
+
+logger = logging.getLogger(__name__)
+
+# seconds between attempts to take an account's session lock while another process (or login) holds it
+SESSION_LOCK_POLL_INTERVAL = 0.25
+# the same retries as `create_session`
+RETRIES = 3
+BACKOFF_FACTOR = 1
+
+
+def create_connector(limit: int = 100, limit_per_host: int = 10) -> aiohttp.TCPConnector:
+    """
+    Creates a connection pool to be shared between many `AsyncAccount`s.
+
+    `limit` caps the total number of open connections and `limit_per_host`
+    caps how many of those may be opened to any single steam host at once.
+    """
+    return aiohttp.TCPConnector(limit=limit, limit_per_host=limit_per_host)
+
+
+async def request(session: aiohttp.ClientSession, method: str, url: str, **kwargs) -> tuple[int, str]:
+    """
+    Sends a request and returns its status and body, backing off and retrying like `create_session`.
+
+    Only 429s and failed connections are retried. After a read error or timeout steam may have already handled a trade,
+    and sending it again would duplicate it. Anything that still fails is raised as `RequestError`.
+    """
+    for attempt in range(RETRIES + 1):
+        try:
+            async with session.request(method, url, **kwargs) as resp:
+                if resp.status != 429 or attempt == RETRIES:
+                    return resp.status, await resp.text()
+                retry_after = resp.headers.get("Retry-After", "")
+        except aiohttp.ClientConnectorError as e:
+            if attempt == RETRIES:
+                raise RequestError(str(e))
+            retry_after = ""
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise RequestError(str(e) or f"{method} {url} timed out")
+        delay = float(retry_after) if retry_after.isdigit() else BACKOFF_FACTOR * 2**attempt
+        logger.debug("Retrying %s %s in %.1fs", method, url, delay)
+        await asyncio.sleep(delay)
+
+
+async def request_text(session: aiohttp.ClientSession, method: str, url: str, **kwargs) -> str:
+    """Returns the body of a page, raising `RequestError` if it wasn't successful."""
+    status, text = await request(session, method, url, **kwargs)
+    if status >= 400:
+        raise RequestError(f"{status} response from {url}")
+    return text
+
+
+async def request_json(session: aiohttp.ClientSession, method: str, url: str, **kwargs) -> Any:
+    """
+    Returns a JSON response, raising `RequestError` if it wasn't successful or isn't JSON.
+    Error responses that explain a failed trade (`strError`) are returned, so the caller can raise `TradeError`.
+    """
+    status, text = await request(session, method, url, **kwargs)
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        raise RequestError(f"{status} response from {url} isn't JSON") from None
+    if status >= 400 and not (isinstance(data, dict) and data.get("strError")):
+        raise RequestError(f"{status} response from {url}")
+    return data
+
+
+class AsyncAccount:
+    """
+    asyncio equivalent of `Account`.
+
+    Each account keeps its own cookies, but every account created with the same
+    `connector` shares one connection pool (and its per-host limits).
+    `cookie_jar` replaces the default jar, ex. with `aiohttp.CookieJar(unsafe=True)` to accept cookies from a local
+    stand-in for steam at an IP address.
+    """
+
+    def __init__(
+        self,
+        username: str,
+        password: str,
+        *,
+        shared_secret: str,
+        identity_secret: str | None = None,
+        priorities: list[ItemType] | None = None,
+        connector: aiohttp.BaseConnector | None = None,
+        cookie_jar: aiohttp.AbstractCookieJar | None = None,
+    ):
+        self._username: str = username
+        self._password: str = password
+        self._shared_secret: str = shared_secret
+        self._identity_secret: str | None = identity_secret
+        self._logged_in: bool = False
+        self._steam_id64: int | None = None
+        self._connector: aiohttp.BaseConnector | None = connector
+        self._session: aiohttp.ClientSession | None = None
+        self._cookie_jar: aiohttp.AbstractCookieJar | None = cookie_jar
+        self._session_id: str | None = None
+        self._session_timestamp: int | None = None
+        self._public_key: rsa.PublicKey | None = None
+        self._timestamp: datetime.datetime | None = None
+        self._priorities: list[ItemType] = priorities or []
+        self._confirmations: dict[int, TradeConfirmation] = {}
+        self._trade_token: str | None = None
+        # held while trading and logging in, so a background refresh never replaces the session mid-trade
+        self._lock: asyncio.Lock | None = None
+
+    def __repr__(self):
+        return (
+            f"<{self.__class__.__name__} "
+            f"username={self.username!r} "
+            f"password={self.password!r} "
+            f"shared_secret={self.shared_secret!r} "
+            f"identify_secret={self.identity_secret!r}"
+            f">"
+        )
+
+    async def __aenter__(self) -> AsyncAccount:
+        return self
+
+    async def __aexit__(self, *_) -> None:
+        await self.close()
+
+    @property
+    def username(self) -> str:
+        return self._username
+
+    @property
+    def password(self) -> str:
+        return self._password
+
+    @password.setter
+    def password(self, new_password: str):
+        if not self.logged_in:
+            self._password = new_password
+
+    @property
+    def shared_secret(self) -> str:
+        return self._shared_secret
+
+    @property
+    def identity_secret(self) -> str:
+        return self._identity_secret
+
+    @property
+    def logged_in(self) -> bool:
+        return self._logged_in
+
+    @property
+    def steam_id64(self) -> int:
+        return self._steam_id64
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        # created lazily so that the session is bound to the running event loop
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=self._connector,
+                connector_owner=self._connector is None,
+                cookie_jar=self._cookie_jar,
+                headers={"User-Agent": "python steam-inventory-manager/v1.0.0"},
+                timeout=aiohttp.ClientTimeout(total=15),
+            )
+        return self._session
+
+    @property
+    def lock(self) -> asyncio.Lock:
+        # created lazily, like the session, so that it's bound to the running event loop
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    @property
+    def session_id(self) -> str:
+        return self._session_id
+
+    @property
+    def session_timestamp(self) -> int | None:
+        """Unix time of the login that created the current session"""
+        return self._session_timestamp
+
+    @property
+    def public_key(self) -> rsa.PublicKey:
+        return self._public_key
+
+    @property
+    def timestamp(self) -> datetime.datetime:
+        return self._timestamp
+
+    @property
+    def priorities(self) -> list[ItemType]:
+        return self._priorities
+
+    @property
+    def encrypted_password(self):
+        return encrypt_password(self.password, self.public_key)
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def trade_token(self) -> str:
+        if self._trade_token is None:
+            url = f"{SteamURL.COMMUNITY}/profiles/{self.steam_id64}/tradeoffers/privacy"
+            self._trade_token = parse_trade_token(await request_text(self.session, "GET", url))
+        return self._trade_token
+
+    async def trade(self, partner: AsyncAccount, me: list = None, them: list = None) -> int:
+        """Sends a trade an returns the trade id"""
+        trade_token = await partner.trade_token()
+        async with self.lock:
+            payload = trade_offer_payload(self.session_id, partner.steam_id64, trade_token, me, them)
+            headers = {"Referer": f"{SteamURL.COMMUNITY}/tradeoffer/new/"}
+            tradeoffer = await request_json(
+                self.session, "POST", f"{SteamURL.COMMUNITY}/tradeoffer/new/send", data=payload, headers=headers
+            )
+
+            if tradeoffer.get("strError"):
+                raise TradeError(tradeoffer["strError"])
+
+            trade_id = int(tradeoffer["tradeofferid"])
+            await self._confirm_trade(trade_id, tradeoffer)
+            return trade_id
+
+    async def accept_trade(self, partner: AsyncAccount, trade_id: int):
+        async with self.lock:
+            payload = {
+                "sessionid": self.session_id,
+                "tradeofferid": trade_id,
+                "serverid": 1,
+                "partner": partner.steam_id64,
+                "captcha": "",
+            }
+            headers = {"Referer": f"{SteamURL.COMMUNITY}/tradeoffer/{trade_id}"}
+            accepted = await request_json(
+                self.session,
+                "POST",
+                f"{SteamURL.COMMUNITY}/tradeoffer/{trade_id}/accept",
+                data=payload,
+                headers=headers,
+            )
+            if accepted.get("strError"):
+                raise TradeError(accepted["strError"])
+            # confirmation shouldn't be needed as `needs_mobile_confirmation` will be False
+            # if no items are present of this account's side
+            await self._confirm_trade(trade_id, accepted)
+
+    async def confirm_trade(self, trade_id: int) -> bool:
+        """
+        Confirms a trade with the mobile authenticator.
+        Returns False if there is no pending confirmation for the trade.
+        """
+        async with self.lock:
+            return await self._confirm(trade_id)
+
+    async def _confirm(self, trade_id: int) -> bool:
+        # asyncio.Lock isn't reentrant, so this expects the caller to hold `lock`
+        await self._fetch_confirmations()
+        confirmation = self._confirmations.pop(trade_id, None)
+        if not confirmation:
+            return False
+        params = self._create_confirmation_params("allow")
+        params["op"] = "allow"
+        params["cid"] = confirmation.data_conf_id
+        params["ck"] = confirmation.data_key
+        confirmed = await request_json(self.session, "GET", f"{SteamURL.COMMUNITY}/mobileconf/ajaxop", params=params)
+
+        if not confirmed.get("success", False):
+            raise TradeError("Failed to accept trade.")
+        return True
+
+    async def _confirm_trade(self, trade_id: int, tradeoffer_resp: dict):
+        if tradeoffer_resp.get("needs_mobile_confirmation", False) and not await self._confirm(trade_id):
+            raise TradeError(f"No confirmation found for trade {trade_id}.")
+
+    async def login(self, code_generator: Callable[[], Awaitable[str]] | None = None, *, force: bool = False):
+        """
+        Logs in, reusing the cached session when possible.
+
+        `code_generator` is only awaited when a full login is required and should return the Steam Guard code to use.
+        `force` skips the cached session and always performs a full login.
+        """
+        if self.logged_in and not force:
+            return self.session
+
+        logger.debug("Logging in...")
+
+        # only one process logs in to an account at a time. the others wait, then reuse the session it stored.
+        # the lock is polled rather than waited on in the executor, so a cancelled login never leaves a thread behind
+        # that takes the lock (and never releases it), and waiting logins don't fill the executor.
+        async with self.lock:
+            lock = cache.session_lock(self.username)
+            while not lock.try_acquire():
+                await asyncio.sleep(SESSION_LOCK_POLL_INTERVAL)
+            try:
+                # when refreshing, a session stored by another process after ours was created is reused too
+                if await self._restore_session(newer_than=self.session_timestamp if force else None):
+                    return self.session
+                await self._full_login(code_generator)
+            finally:
+                lock.release()
+
+    async def _full_login(self, code_generator: Callable[[], Awaitable[str]] | None):
+        if not self.password:
+            raise IncorrectPassword("password not specified")
+
+        self._public_key, self._timestamp = await self._rsa_key()
+        one_time_code = await code_generator() if code_generator else generate_one_time_code(self.shared_secret)
+        attempt = await self._attempt_login(one_time_code)
+
+        if attempt.get("success", False) and attempt.get("login_complete"):
+
+            logger.debug("Successfully logged in")
+
+            # successfully logged in
+            self._logged_in = True
+
+            for cookie in list(self.session.cookie_jar):
+                self._transfer_cookie(cookie.key, cookie.value)
+
+            self._session_id = generate_session_id()
+            self._transfer_cookie("sessionid", self.session_id)
+            self._session_timestamp = int(time())
+
+            transfer_parameters = attempt["transfer_parameters"]
+            self._steam_id64 = transfer_parameters["steamid"]
+            await self._log_session()
+            return
+
+        raise_for_login(attempt)
+
+    async def _attempt_login(self, one_time_code: str):
+        data = {
+            "username": self.username,
+            "password": self.encrypted_password,
+            "emailauth": "",
+            "emailsteamid": "",
+            "twofactorcode": one_time_code,
+            "captchagid": -1,
+            "captcha_text": "",
+            "loginfriendlyname": self.session.headers["User-Agent"],
+            "rsatimestamp": self.timestamp,
+            "remember_login": "true",
+            "donotcache": do_no_cache(),
+        }
+        _, text = await request(self.session, "POST", f"{SteamURL.COMMUNITY}/login/dologin/", data=data)
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError as e:
+            raise LoginError(str(e))
+
+    async def _rsa_key(self) -> tuple[rsa.PublicKey, datetime.datetime]:
+        rsa_key = await request_json(
+            self.session,
+            "POST",
+            f"{SteamURL.COMMUNITY}/login/getrsakey/",
+            data={"username": self.username, "donotcache": do_no_cache()},
+        )
+        return parse_rsa_key(rsa_key)
+
+    def _transfer_cookie(self, name: str, value: str):
+        """sets a cookie for the three main steam domains"""
+        for domain in ["store.steampowered.com", "help.steampowered.com", "steamcommunity.com"]:
+            self.session.cookie_jar.update_cookies({name: value}, URL(f"https://{domain}"))
+
+    def _create_confirmation_params(self, tag: str) -> dict[str, Any]:
+        return generate_confirmation_params(self.steam_id64, self.identity_secret, tag)
+
+    async def _fetch_confirmations(self):
+        params = self._create_confirmation_params("conf")
+        headers = {"X-Requested-With": "com.valvesoftware.android.steam.community"}
+        page = await request_text(
+            self.session, "GET", f"{SteamURL.COMMUNITY}/mobileconf/conf", params=params, headers=headers
+        )
+        self._confirmations.update(parse_confirmations(page))
+        return self._confirmations
+
+    async def session_alive(self) -> bool:
+        """Checks with steam whether the current session is still logged in."""
+        cookies = self.session.cookie_jar.filter_cookies(URL("https://steamcommunity.com"))
+        if not self.session_id or "steamLoginSecure" not in cookies:
+            return False
+        return await self._test_login(self.session_id, cookies["steamLoginSecure"].value)
+
+    async def _test_login(self, session_id: str, steam_login_secure: str) -> bool:
+        async with self.session.get(
+            f"{SteamURL.COMMUNITY}/my/profile",
+            cookies={"sessionid": session_id, "steamLoginSecure": steam_login_secure},
+        ) as resp:
+            # redirects to profile if logged in else brings you to login page
+            return "login/home" not in str(resp.url)
+
+    async def _restore_session(self, newer_than: int | None = None) -> bool:
+        """Restores the cached session, if it works (and was created after `newer_than`)."""
+        # reading the cache means decrypting it, so it's kept off the event loop
+        account_data = await asyncio.get_running_loop().run_in_executor(None, cache.session_data, self.username)
+        if not account_data:
+            return False
+        if newer_than is not None and account_data.get("timestamp", 0) <= newer_than:
+            return False
+        session_id = account_data["session_id"]
+        steam_id64 = account_data["steam_id64"]
+        steam_login_secure = account_data["steam_login_secure"]
+        if not await self._test_login(session_id, steam_login_secure):
+            logger.debug("Failed to login with cached credentials.")
+            return False
+        self._logged_in = True
+        self._session_id = session_id
+        self._steam_id64 = steam_id64
+        # sessions cached before timestamps were stored are treated as old
+        self._session_timestamp = account_data.get("timestamp", 0)
+        self._transfer_cookie("sessionid", self.session_id)
+        self._transfer_cookie(name="steamLoginSecure", value=steam_login_secure)
+        return True
+
+    async def _log_session(self):
+        # this should always be set, but just in case, we don't want to set bad data in the json file.
+        cookies = self.session.cookie_jar.filter_cookies(URL("https://steamcommunity.com"))
+        if "steamLoginSecure" in cookies and self.session_id and self.steam_id64:
+            session_data: SessionData = {
+                "session_id": self.session_id,
+                "steam_id64": self.steam_id64,
+                "steam_login_secure": cookies["steamLoginSecure"].value,
+                "timestamp": self.session_timestamp,
+            }
+            await asyncio.get_running_loop().run_in_executor(None, cache.store_session_data, self.username, session_data)
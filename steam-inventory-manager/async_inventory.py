@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from .async_account import request_json
+from .datatypes import SteamURL
+from .utils import parse_inventory
+
+if TYPE_CHECKING:
+    from typing import AsyncIterator
+
+    import aiohttp
+    from .datatypes import Item
+    from .decisions import DecisionCache
+
+
+class AsyncInventory:
+    """
+    asyncio equivalent of `Inventory`.
+
+    Requests go through the given session, so inventories fetched with an `AsyncAccount.session`
+    share that account's connection pool.
+    """
+
+    def __init__(self, steam_id64: int, session: aiohttp.ClientSession, decisions: DecisionCache | None = None) -> None:
+        self.steam_id64: int = steam_id64
+        self._session: aiohttp.ClientSession = session
+        # a single cache can be shared between every inventory, save it once they've all been fetched
+        self.decisions: DecisionCache | None = decisions
+        self._items: list[Item] | None = None
+
+    async def pages(self) -> AsyncIterator[dict]:
+        """Yields the raw inventory, one page (of up to 5000 assets) at a time. Failed requests raise `RequestError`."""
+        params = {"l": "english", "count": 5000}
+        while True:
+            url = f"{SteamURL.COMMUNITY}/inventory/{self.steam_id64}/730/2"
+            page = await request_json(self._session, "GET", url, params=params)
+            yield page
+            if not page.get("more_items"):
+                return
+            params["start_assetid"] = page["last_assetid"]
+
+    async def items(self) -> list[Item]:
+        if self._items is None:
+            items: list[Item] = []
+            async for page in self.pages():
+                items.extend(parse_inventory(page, self.decisions))
+            self._items = items
+        return self._items
+
+    async def items_to_trade(self) -> list[Item]:
+        if self.decisions:
+            return [item for item in await self.items() if self.decisions.should_be_traded(item)]
+        return [item for item in await self.items() if item.should_be_traded]
@@ -3,14 +3,23 @@ from __future__ import annotations
 import base64
 import json
 import logging
+import os
 import pathlib
 import sys
+import tempfile
+import time
 import uuid
 from typing import TYPE_CHECKING
 
 from cryptography.fernet import Fernet, InvalidToken
 
+if sys.platform == "win32":
+    import msvcrt
+else:
+    import fcntl
+
 if TYPE_CHECKING:
+    from typing import BinaryIO
     from .datatypes import SessionData
 
 logger = logging.getLogger(__name__)
@@ -22,9 +31,9 @@ thirty_two = (hardware_id * 3)[:-4]
 fernet = Fernet(base64.b64encode(thirty_two.encode()))
 
 
-def cache_file(account_name: str) -> pathlib.Path | None:
+def cache_directory() -> pathlib.Path | None:
     """
-    Returns a parent directory path
+    Returns a directory path
     where persistent application data can be stored.
 
     # linux: ~/.local/share
@@ -34,6 +43,12 @@ def cache_file(account_name: str) -> pathlib.Path | None:
     References:
         https://doc.qt.io/qt-5/qstandardpaths.html
     """
+    # can be overridden, ex. to keep a load test's data apart from real sessions
+    if os.environ.get("STEAM_INVENTORY_MANAGER_CACHE"):
+        directory = pathlib.Path(os.environ["STEAM_INVENTORY_MANAGER_CACHE"])
+        directory.mkdir(parents=True, exist_ok=True)
+        return directory
+
     home = pathlib.Path.home()
 
     if sys.platform == "win32":
@@ -47,7 +62,113 @@ def cache_file(account_name: str) -> pathlib.Path | None:
 
     directory = appdata_equivalent / "steam-inventory-manager"
     directory.mkdir(exist_ok=True)
-    return directory / account_name
+    return directory
+
+
+def cache_file(name: str) -> pathlib.Path | None:
+    directory = cache_directory()
+    if not directory:
+        return
+    return directory / name
+
+
+class FileLock:
+    """
+    An exclusive lock shared between processes, held on a lock file.
+    Blocks until any other holder releases it.
+    """
+
+    def __init__(self, path: pathlib.Path) -> None:
+        self.path = path
+        self._file: BinaryIO | None = None
+
+    def __enter__(self) -> FileLock:
+        self.acquire()
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.release()
+
+    def acquire(self) -> None:
+        self._file = open(self.path, "a+b")
+        if sys.platform == "win32":
+            while True:
+                try:
+                    self._file.seek(0)
+                    msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+                    return
+                except OSError:
+                    # LK_LOCK gives up after ~10 seconds
+                    continue
+        else:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+
+    def try_acquire(self) -> bool:
+        """Acquires the lock without waiting. Returns whether it was acquired."""
+        file = open(self.path, "a+b")
+        try:
+            if sys.platform == "win32":
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            file.close()
+            return False
+        self._file = file
+        return True
+
+    def release(self) -> None:
+        if not self._file:
+            return
+        if sys.platform == "win32":
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        self._file.close()
+        self._file = None
+
+
+class NullLock:
+    """Used when there is no cache directory, and so nothing to coordinate."""
+
+    def __enter__(self) -> NullLock:
+        return self
+
+    def __exit__(self, *_) -> None:
+        pass
+
+    def acquire(self) -> None:
+        pass
+
+    def try_acquire(self) -> bool:
+        return True
+
+    def release(self) -> None:
+        pass
+
+
+def session_lock(account_name: str) -> FileLock | NullLock:
+    """
+    Returns the lock guarding an account's login.
+    Holding it while logging in means concurrent processes wait and reuse the session instead of each logging in.
+    """
+    file = cache_file(f"{account_name}.lock")
+    return FileLock(file) if file else NullLock()
+
+
+def write_atomic(file: pathlib.Path, data: bytes) -> None:
+    """Writes a file so that readers see either the old or new contents, never a partial write."""
+    with tempfile.NamedTemporaryFile(dir=file.parent, prefix=f".{file.name}.", delete=False) as temp:
+        temp.write(data)
+        temp.flush()
+        os.fsync(temp.fileno())
+    os.replace(temp.name, file)
+
+
+# path -> ((modification time, inode), session data)
+_session_reads: dict[pathlib.Path, tuple[tuple[int, int], SessionData]] = {}
 
 
 def session_data(account_name: str) -> SessionData | None:
@@ -56,14 +177,22 @@ def session_data(account_name: str) -> SessionData | None:
         logger.debug("No cached data found.")
         return
     try:
-        with open(file, "rb") as file:
-            encrypted = file.read()
+        # only re-read (and decrypt) the file once another process has replaced it.
+        # the modification time alone can miss a replace on filesystems with coarse timestamps, the inode can't.
+        stat = file.stat()
+        version = (stat.st_mtime_ns, stat.st_ino)
+        if file in _session_reads and _session_reads[file][0] == version:
+            return _session_reads[file][1]
+
+        with open(file, "rb") as f:
+            encrypted = f.read()
 
         decrypted = fernet.decrypt(encrypted).decode()
         deserialized = json.loads(decrypted)
 
         logger.debug("Reading cache file:")
-        logger.debug(f"{deserialized=}")
+        logger.debug("deserialized=%r", deserialized)
+        _session_reads[file] = (version, deserialized)
         return deserialized
     except (json.JSONDecodeError, FileNotFoundError, InvalidToken):
         logger.debug("Failed to read from cache file.")
@@ -75,10 +204,49 @@ def store_session_data(account_name: str, data: SessionData) -> None:
     if not file:
         return
     logger.debug("Writing to cache file:")
-    logger.debug(f"{data=}")
-    logger.debug(f"{file=}")
+    logger.debug("data=%r", data)
+    logger.debug("file=%r", file)
+
+    serialized = json.dumps(data)
+    encrypted = fernet.encrypt(serialized.encode())
+    write_atomic(file, encrypted)
+
 
-    with open(file, "wb") as file:
-        serialized = json.dumps(data)
-        encrypted = fernet.encrypt(serialized.encode())
-        file.write(encrypted)
+def price_data(provider_name: str) -> tuple[float, dict[str, float]] | None:
+    """Returns when the provider's prices were stored, and the prices themselves."""
+    file = cache_file(f"prices-{provider_name}.json")
+    if not file or not file.exists():
+        return
+    try:
+        with open(file, "r", encoding="utf-8") as file:
+            data = json.load(file)
+        return data["timestamp"], data["prices"]
+    except (json.JSONDecodeError, FileNotFoundError, KeyError):
+        logger.debug("Failed to read cached prices for %s.", provider_name)
+        return
+
+
+def store_price_data(provider_name: str, prices: dict[str, float]) -> None:
+    file = cache_file(f"prices-{provider_name}.json")
+    if not file:
+        return
+    write_atomic(file, json.dumps({"timestamp": time.time(), "prices": prices}).encode())
+
+
+def decision_data() -> dict[str, list] | None:
+    file = cache_file("decisions.json")
+    if not file or not file.exists():
+        return
+    try:
+        with open(file, "r", encoding="utf-8") as file:
+            return json.load(file)
+    except (json.JSONDecodeError, FileNotFoundError):
+        logger.debug("Failed to read cached decisions.")
+        return
+
+
+def store_decision_data(data: dict[str, list]) -> None:
+    file = cache_file("decisions.json")
+    if not file:
+        return
+    write_atomic(file, json.dumps(data).encode())
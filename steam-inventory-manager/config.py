@@ -1,24 +1,254 @@
 from __future__ import annotations
 
+import base64
+import binascii
+import hashlib
+import json
+import logging
+import os
 import pathlib
+import re
+from dataclasses import dataclass
+from types import MappingProxyType
 from typing import TYPE_CHECKING
 
 import yaml
 
+# datatypes imports this module, so only the module is imported here. its contents are used once compiling.
+from . import datatypes, prices
 from .exceptions import ConfigurationError
 
 if TYPE_CHECKING:
-    from .datatypes import ConfigurationAccount, ConfigurationOptions
-
-try:
-    config_file = pathlib.Path(__file__).parents[1] / "config.yaml"
-    config = yaml.safe_load(config_file.read_text(encoding="utf-8"))
-except yaml.YAMLError:
-    raise ConfigurationError("failed to load config.yaml")
-
-try:
-    main_account: ConfigurationAccount = config["main-account"]
-    alternate_accounts: list[ConfigurationAccount] = config["alternate-accounts"]
-    options: ConfigurationOptions = config["options"]
-except KeyError as e:
-    raise ConfigurationError(f"key, {e} not present in config.yaml") from None
+    from typing import Any, Mapping
+    from .datatypes import ConfigurationAccount, ConfigurationOptions, ItemType
+
+logger = logging.getLogger(__name__)
+
+# can be overridden, ex. to run with a generated config while load testing
+config_file = pathlib.Path(
+    os.environ.get("STEAM_INVENTORY_MANAGER_CONFIG") or pathlib.Path(__file__).parents[1] / "config.yaml"
+)
+
+# option -> the item type it always trades
+ALWAYS_TRADE_OPTIONS = {
+    "always-trade-graffities": "Graffiti",
+    "always-trade-stickers": "Sticker",
+    "always-trade-agents": "Agent",
+    "always-trade-containers": "Container",
+    "always-trade-collectibles": "Collectible",
+    "always-trade-patches": "Patch",
+}
+OPTIONS = {"min-price", "auto-accept-trades", "price-providers", "log-level", "log-format", *ALWAYS_TRADE_OPTIONS}
+LOG_LEVELS = {"DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"}
+LOG_FORMATS = {"colored", "json"}
+BASE64 = re.compile(r"[A-Za-z0-9+/]+=*")
+
+
+@dataclass(frozen=True)
+class AccountConfig:
+    username: str
+    password: str
+    shared_secret: str
+    identity_secret: str | None
+    priorities: tuple[ItemType, ...]
+
+
+@dataclass(frozen=True)
+class Options:
+    min_price: float
+    auto_accept_trades: bool
+    # item types that are traded regardless of price
+    always_trade: frozenset[ItemType]
+    price_providers: tuple[str, ...]
+    log_level: int
+    log_format: str
+    # identifies the options that decide whether an item is traded. changes whenever any of them do.
+    rules_version: str
+
+
+@dataclass(frozen=True)
+class Configuration:
+    main_account: AccountConfig
+    alternate_accounts: tuple[AccountConfig, ...]
+    options: Options
+    # item type -> username of the first alternate account that prioritizes it
+    priorities: Mapping[ItemType, str]
+
+
+_current: Configuration | None = None
+_mtime: int | None = None
+
+
+def current() -> Configuration:
+    """Returns the compiled config, compiling config.yaml the first time."""
+    global _current, _mtime
+    if _current is None:
+        mtime = _modified()
+        _current = compile_config(_read())
+        _mtime = mtime
+    return _current
+
+
+def reload() -> bool:
+    """
+    Compiles config.yaml again if it was modified since it was last compiled. Returns whether it was.
+    A config that fails to compile is logged and ignored, so the running config is kept.
+    """
+    global _current, _mtime
+    mtime = _modified()
+    if _current is not None and mtime == _mtime:
+        return False
+    try:
+        _current = compile_config(_read())
+    except ConfigurationError as e:
+        if _current is None:
+            raise
+        logger.error("Ignoring the changes to %s: %s", config_file.name, e)
+        # don't report the same broken config again
+        _mtime = mtime
+        return False
+    _mtime = mtime
+    logger.info("Reloaded %s", config_file.name)
+    return True
+
+
+def compile_config(raw: Any) -> Configuration:
+    """Validates a loaded config.yaml, and precomputes everything that's looked up while running."""
+    if not isinstance(raw, dict):
+        raise ConfigurationError("config.yaml must be a mapping")
+    for key in ("main-account", "alternate-accounts", "options"):
+        if key not in raw:
+            raise ConfigurationError(f"key, '{key}' not present in config.yaml")
+    if not isinstance(raw["alternate-accounts"], list) or not raw["alternate-accounts"]:
+        raise ConfigurationError("alternate-accounts must be a list of at least one account")
+
+    main_account = _compile_account(raw["main-account"], "main-account")
+    alternate_accounts = tuple(
+        _compile_account(account, f"alternate-accounts[{index}]")
+        for index, account in enumerate(raw["alternate-accounts"])
+    )
+    options = _compile_options(raw["options"])
+
+    if options.auto_accept_trades and not main_account.identity_secret:
+        raise ConfigurationError("auto-accept-trades is enabled but no identity secret was provided.")
+
+    priorities: dict[ItemType, str] = {}
+    for account in alternate_accounts:
+        for item_type in account.priorities:
+            priorities.setdefault(item_type, account.username)
+
+    return Configuration(
+        main_account=main_account,
+        alternate_accounts=alternate_accounts,
+        options=options,
+        priorities=MappingProxyType(priorities),
+    )
+
+
+def _compile_account(raw: ConfigurationAccount, where: str) -> AccountConfig:
+    if not isinstance(raw, dict):
+        raise ConfigurationError(f"{where} must be a mapping")
+    for key in ("username", "password", "shared-secret"):
+        if not isinstance(raw.get(key), str) or not raw[key]:
+            raise ConfigurationError(f"{where}.{key} must be a non-empty string")
+    for key in ("shared-secret", "identity-secret"):
+        if raw.get(key) is None:
+            continue
+        if not _is_base64(raw[key]):
+            raise ConfigurationError(f"{where}.{key} isn't valid base64")
+
+    raw_priorities = raw.get("priorities") or []
+    if not isinstance(raw_priorities, list):
+        raise ConfigurationError(f"{where}.priorities must be a list")
+    return AccountConfig(
+        username=raw["username"],
+        password=raw["password"],
+        shared_secret=raw["shared-secret"],
+        identity_secret=raw.get("identity-secret"),
+        priorities=tuple(_item_type(priority, f"{where}.priorities") for priority in raw_priorities),
+    )
+
+
+def _compile_options(raw: ConfigurationOptions) -> Options:
+    if not isinstance(raw, dict):
+        raise ConfigurationError("options must be a mapping")
+    unknown = set(raw) - OPTIONS
+    if unknown:
+        raise ConfigurationError(f"unknown option(s): {', '.join(sorted(unknown))}")
+
+    min_price = raw.get("min-price")
+    # bool is an int, but `min-price: true` is almost certainly a mistake
+    if isinstance(min_price, bool) or not isinstance(min_price, (int, float)) or min_price < 0:
+        raise ConfigurationError("min-price must be a number, 0 or more")
+    if not isinstance(raw.get("auto-accept-trades"), bool):
+        raise ConfigurationError("auto-accept-trades must be true or false")
+
+    always_trade: set[ItemType] = set()
+    for key, type_value in ALWAYS_TRADE_OPTIONS.items():
+        value = raw.get(key, False)
+        if not isinstance(value, bool):
+            raise ConfigurationError(f"{key} must be true or false")
+        if value:
+            always_trade.add(datatypes.ItemType(type_value))
+
+    price_providers = raw.get("price-providers") or list(prices.PROVIDERS)
+    if not isinstance(price_providers, list) or not all(isinstance(name, str) for name in price_providers):
+        raise ConfigurationError("price-providers must be a list of names")
+    unknown = set(price_providers) - set(prices.PROVIDERS)
+    if unknown:
+        raise ConfigurationError(f"unknown price provider(s): {', '.join(sorted(unknown))}")
+
+    log_level = str(raw.get("log-level") or "INFO").upper()
+    if log_level not in LOG_LEVELS:
+        raise ConfigurationError(f"log-level must be one of {', '.join(sorted(LOG_LEVELS))}")
+    log_format = raw.get("log-format") or "colored"
+    if log_format not in LOG_FORMATS:
+        raise ConfigurationError(f"log-format must be one of {', '.join(sorted(LOG_FORMATS))}")
+
+    rules = {"min-price": float(min_price), "always-trade": sorted(item_type.value for item_type in always_trade)}
+    return Options(
+        min_price=float(min_price),
+        auto_accept_trades=raw["auto-accept-trades"],
+        always_trade=frozenset(always_trade),
+        price_providers=tuple(price_providers),
+        log_level=logging.getLevelName(log_level),
+        log_format=log_format,
+        rules_version=hashlib.sha1(json.dumps(rules, sort_keys=True).encode()).hexdigest()[:16],
+    )
+
+
+def _item_type(value: Any, where: str) -> ItemType:
+    if not isinstance(value, str):
+        raise ConfigurationError(f"{where} must only contain strings")
+    # "sniper rifle" -> "Sniper Rifle", except for "SMG"
+    caps = value.title() if value.upper() != "SMG" else "SMG"
+    try:
+        return datatypes.ItemType(caps)
+    except ValueError:
+        valid = ", ".join(item_type.value for item_type in datatypes.ItemType)
+        raise ConfigurationError(f"{where} has an unknown item type, '{value}' (must be one of {valid})") from None
+
+
+def _is_base64(value: Any) -> bool:
+    # b64decode(validate=True) would also reject extra padding, which secrets are sometimes copied with (and which works)
+    if not isinstance(value, str) or not BASE64.fullmatch(value):
+        return False
+    try:
+        base64.b64decode(value)
+    except binascii.Error:
+        return False
+    return True
+
+
+def _modified() -> int:
+    try:
+        return config_file.stat().st_mtime_ns
+    except FileNotFoundError:
+        raise ConfigurationError(f"{config_file} doesn't exist") from None
+
+
+def _read() -> Any:
+    try:
+        return yaml.safe_load(config_file.read_text(encoding="utf-8"))
+    except yaml.YAMLError:
+        raise ConfigurationError("failed to load config.yaml") from None
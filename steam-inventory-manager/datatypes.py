@@ -1,14 +1,10 @@
 from dataclasses import dataclass
-from enum import Enum
+from enum import Enum, IntEnum
 from typing import Optional, TypedDict
 
-import requests
+from . import config, prices
 
-from . import config
-
-PRICES = requests.get("https://csgobackpack.net/api/GetItemsList/v2/").json()["items_list"]
-
-# for config.py
+# for config.yaml, before it's compiled by config.py
 
 ConfigurationAccount = TypedDict(
     "ConfigurationAccount",
@@ -26,6 +22,9 @@ ConfigurationOptions = TypedDict(
         "always-trade-containers": bool,
         "always-trade-collectibles": bool,
         "always-trade-patches": bool,
+        "price-providers": Optional[list[str]],
+        "log-level": Optional[str],
+        "log-format": Optional[str],
     },
 )
 
@@ -34,11 +33,19 @@ class SessionData(TypedDict):
     session_id: str
     steam_id64: int
     steam_login_secure: str
+    # unix time of the login that created the session
+    timestamp: int
 
 
 # for steam stuff
 
 
+class SteamURL:
+    # can be pointed somewhere else, ex. a local fake steam server for load testing
+    COMMUNITY = "https://steamcommunity.com"
+    API = "https://api.steampowered.com"
+
+
 @dataclass
 class TradeConfirmation:
     id: str
@@ -47,6 +54,33 @@ class TradeConfirmation:
     trade_id: int
 
 
+class TradeOfferState(IntEnum):
+    # https://developer.valvesoftware.com/wiki/Steam_Web_API/IEconService#ETradeOfferState
+    INVALID = 1
+    ACTIVE = 2
+    ACCEPTED = 3
+    COUNTERED = 4
+    EXPIRED = 5
+    CANCELED = 6
+    DECLINED = 7
+    INVALID_ITEMS = 8
+    CREATED_NEEDS_CONFIRMATION = 9
+    CANCELED_BY_SECOND_FACTOR = 10
+    IN_ESCROW = 11
+
+    @property
+    def is_final(self):
+        return self not in {
+            TradeOfferState.ACTIVE,
+            TradeOfferState.CREATED_NEEDS_CONFIRMATION,
+            TradeOfferState.IN_ESCROW,
+        }
+
+    @property
+    def failed(self):
+        return self.is_final and self != TradeOfferState.ACCEPTED
+
+
 class ItemExterior(Enum):
     FACTORY_NEW = "Factory New"
     MINIMAL_WEAR = "Minimal Wear"
@@ -87,6 +121,9 @@ class Item:
     # not required
     exterior: Optional[ItemExterior] = None
     type: Optional[ItemType] = None
+    # identifies the item's description, shared by every copy of the same item
+    classid: Optional[str] = None
+    instanceid: Optional[str] = None
 
     @property
     def is_weapon(self):
@@ -113,32 +150,25 @@ class Item:
 
     @property
     def price(self) -> float:
-        if self.market_name not in PRICES:
-            return -1
-        item = PRICES[self.market_name]
-        if "price" not in item:
-            return -1
-        # imo median is better then an average because of extreme undercuts
-        # and super high prices skewing the average
-        queue = ("30_days", "all_time", "7_days", "24_hours")
-        for key in queue:
-            if key in item["price"]:
-                return item["price"][key]["median"]
-        return -1
+        return prices.price(self.market_name)
 
     @property
     def should_be_traded(self):
-        if config.options["always-trade-graffities"] and self.type == ItemType.GRAFFITI:
-            return True
-        if config.options["always-trade-stickers"] and self.type == ItemType.STICKER:
-            return True
-        if config.options["always-trade-agents"] and self.type == ItemType.AGENT:
-            return True
-        if config.options["always-trade-containers"] and self.type == ItemType.CONTAINER:
-            return True
-        if config.options["always-trade-collectibles"] and self.type == ItemType.COLLECTIBLE:
-            return True
-        if config.options["always-trade-patches"] and self.type == ItemType.PATCH:
+        options = config.current().options
+        if self.type in options.always_trade:
             return True
+        price = self.price
         # if the item doesn't have a price, it's likely just a pricing issue and shouldn't be traded.
-        return self.price < config.options["min-price"] and self.price != -1
+        return price < options.min_price and price != -1
+
+
+@dataclass
+class Decision:
+    """Everything worked out about an item description. Shared by every asset with that description."""
+
+    name: str
+    market_name: str
+    exterior: Optional[ItemExterior]
+    type: Optional[ItemType]
+    price: float
+    trade: bool
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import logging
+from collections import OrderedDict
+
+from . import cache, config, prices
+from .datatypes import Decision, Item, ItemExterior, ItemType
+from .utils import parse_description
+
+logger = logging.getLogger(__name__)
+
+
+class DecisionCache:
+    """
+    Remembers the parsed details, price, and trade decision of each item description.
+
+    Copies of an item share a description (classid/instanceid), so each description is only evaluated once.
+    Entries are keyed on the price snapshot and trading rules too, so changing either of them re-evaluates everything.
+    The least recently used entries are evicted past `max_size`.
+    """
+
+    def __init__(self, entries: OrderedDict[str, Decision] | None = None, max_size: int = 100_000) -> None:
+        self._entries: OrderedDict[str, Decision] = entries or OrderedDict()
+        self.max_size: int = max_size
+        self.hits: int = 0
+        self.misses: int = 0
+
+    @classmethod
+    def open(cls, max_size: int = 100_000) -> DecisionCache:
+        """Loads the decisions cached by previous runs, skipping any made with different trading rules."""
+        suffix = f"_{config.current().options.rules_version}"
+        entries: OrderedDict[str, Decision] = OrderedDict()
+        for key, (name, market_name, exterior, item_type, price, trade) in (cache.decision_data() or {}).items():
+            if not key.endswith(suffix):
+                continue
+            entries[key] = Decision(
+                name=name,
+                market_name=market_name,
+                exterior=ItemExterior(exterior) if exterior else None,
+                type=ItemType(item_type) if item_type else None,
+                price=price,
+                trade=trade,
+            )
+        return cls(entries, max_size)
+
+    def save(self) -> None:
+        """Stores the decisions made with the current prices and rules. Ones made with older versions are dropped."""
+        suffix = f"_{self._version()}"
+        data = {
+            key: [
+                decision.name,
+                decision.market_name,
+                decision.exterior.value if decision.exterior else None,
+                decision.type.value if decision.type else None,
+                decision.price,
+                decision.trade,
+            ]
+            for key, decision in self._entries.items()
+            if key.endswith(suffix)
+        }
+        cache.store_decision_data(data)
+        logger.debug("Saved %d decisions (%d hits, %d misses).", len(data), self.hits, self.misses)
+
+    def resolve(self, description: dict) -> Decision:
+        key = self._key(description["classid"], description.get("instanceid", "0"))
+        decision = self._entries.get(key)
+        if decision:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return decision
+
+        self.misses += 1
+        name, item_exterior, item_type = parse_description(description)
+        # a stand-in item, only used for its price and trade decision
+        item = Item(name=name, appid=730, contextid="2", amount=1, assetid=0, exterior=item_exterior, type=item_type)
+        decision = Decision(
+            name=name,
+            market_name=item.market_name,
+            exterior=item_exterior,
+            type=item_type,
+            price=item.price,
+            trade=item.should_be_traded,
+        )
+        self._entries[key] = decision
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        return decision
+
+    def should_be_traded(self, item: Item) -> bool:
+        decision = self._entries.get(self._key(item.classid, item.instanceid)) if item.classid else None
+        return decision.trade if decision else item.should_be_traded
+
+    def _key(self, classid: str, instanceid: str) -> str:
+        return f"{classid}_{instanceid}_{self._version()}"
+
+    @staticmethod
+    def _version() -> str:
+        return f"{prices.version()}_{config.current().options.rules_version}"
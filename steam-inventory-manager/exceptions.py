@@ -39,3 +39,7 @@ class CaptchaRequired(LoginError):
 
 class EmailCodeRequired(LoginError):
     """Raises when an account has email verification enabled instead of mobile verification."""
+
+
+class ExportError(SteamInventoryManagerError):
+    """Raises when an inventory export can't be written."""
@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+import csv
+import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
+from .exceptions import ExportError
+from .inventory import Inventory
+from .profiling import profiled
+
+if TYPE_CHECKING:
+    from typing import Iterator
+    from .account import Account
+    from .decisions import DecisionCache
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = (
+    "account",
+    "steam_id64",
+    "assetid",
+    "classid",
+    "instanceid",
+    "amount",
+    "name",
+    "market_name",
+    "type",
+    "exterior",
+    "price",
+    "tradable",
+    "trade",
+)
+
+# how many fetched pages may wait for the writer before the fetching threads block
+MAX_PENDING_PAGES = 8
+# how many inventories are fetched at once
+MAX_FETCH_WORKERS = 16
+
+
+class CSVWriter:
+    def __init__(self, path: str) -> None:
+        self._file = open(path, "w", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(COLUMNS)
+
+    def write(self, rows: list[tuple]) -> None:
+        self._writer.writerows(rows)
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class ParquetWriter:
+    """Writes each batch of rows as its own row group, so only one page is ever held in memory."""
+
+    def __init__(self, path: str) -> None:
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ExportError("Exporting to parquet requires pyarrow. (pip install pyarrow)") from None
+
+        self._pyarrow = pyarrow
+        string = pyarrow.string()
+        self._schema = pyarrow.schema(
+            [
+                ("account", string),
+                ("steam_id64", pyarrow.uint64()),
+                ("assetid", string),
+                ("classid", string),
+                ("instanceid", string),
+                ("amount", pyarrow.int32()),
+                ("name", string),
+                ("market_name", string),
+                # low cardinality, so these are stored as dictionaries
+                ("type", pyarrow.dictionary(pyarrow.int8(), string)),
+                ("exterior", pyarrow.dictionary(pyarrow.int8(), string)),
+                ("price", pyarrow.float64()),
+                ("tradable", pyarrow.bool_()),
+                ("trade", pyarrow.bool_()),
+            ]
+        )
+        self._writer = pyarrow.parquet.ParquetWriter(path, self._schema, compression="zstd")
+
+    def write(self, rows: list[tuple]) -> None:
+        if not rows:
+            return
+        columns = dict(zip(COLUMNS, (list(column) for column in zip(*rows))))
+        self._writer.write_table(self._pyarrow.Table.from_pydict(columns, schema=self._schema))
+
+    def close(self) -> None:
+        self._writer.close()
+
+
+def open_writer(path: str, output_format: str | None = None) -> CSVWriter | ParquetWriter:
+    """Opens a writer for `path`. The format is guessed from the file extension if it isn't given."""
+    output_format = output_format or ("parquet" if path.endswith(".parquet") else "csv")
+    if output_format == "parquet":
+        return ParquetWriter(path)
+    if output_format == "csv":
+        return CSVWriter(path)
+    raise ExportError(f"Unknown export format: {output_format}")
+
+
+def page_rows(account: Account, page: dict, decisions: DecisionCache) -> list[tuple]:
+    """Turns an inventory page into rows. Unlike `parse_inventory`, items that aren't tradable are kept."""
+    descriptions: dict[tuple[str, str], dict] = {
+        (x["classid"], x.get("instanceid", "0")): x for x in page.get("descriptions", [])
+    }
+    rows: list[tuple] = []
+    for asset in page.get("assets", []):
+        instanceid = asset.get("instanceid", "0")
+        description = descriptions.get((asset["classid"], instanceid))
+        if description is None:
+            logger.debug("Asset %s has no description, skipping it.", asset["assetid"])
+            continue
+        decision = decisions.resolve(description)
+        tradable = bool(description.get("tradable"))
+        rows.append(
+            (
+                account.username,
+                int(account.steam_id64),
+                asset["assetid"],
+                asset["classid"],
+                instanceid,
+                int(asset.get("amount", 1)),
+                decision.name,
+                decision.market_name,
+                decision.type.value if decision.type else None,
+                decision.exterior.value if decision.exterior else None,
+                # -1 means that the item isn't priced
+                decision.price if decision.price != -1 else None,
+                tradable,
+                tradable and decision.trade,
+            )
+        )
+    return rows
+
+
+def export_inventories(
+    accounts: list[Account],
+    decisions: DecisionCache,
+    path: str,
+    output_format: str | None = None,
+    max_workers: int = MAX_FETCH_WORKERS,
+) -> int:
+    """
+    Streams every asset of every account to `path`, one inventory page at a time.
+
+    Inventories are fetched concurrently, while pages are parsed and written on the calling thread,
+    so memory use stays at a handful of pages no matter how big the inventories are.
+    Returns the number of rows written.
+    """
+    writer = open_writer(path, output_format)
+    # (account, page), or (account, None) once an account is done
+    pages: queue.Queue[tuple[Account, dict | None]] = queue.Queue(maxsize=MAX_PENDING_PAGES)
+
+    # set if writing fails, so that the fetching threads don't block on a full queue forever
+    cancelled = threading.Event()
+
+    def put(item: tuple[Account, dict | None]) -> None:
+        while not cancelled.is_set():
+            try:
+                pages.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def fetch(account: Account) -> None:
+        try:
+            for page in Inventory(account.steam_id64).pages():
+                if cancelled.is_set():
+                    return
+                put((account, page))
+        finally:
+            put((account, None))
+
+    written = 0
+    try:
+        with ThreadPoolExecutor(max_workers=min(len(accounts), max_workers) or 1) as executor:
+            futures = [executor.submit(profiled(fetch), account) for account in accounts]
+            try:
+                for account, page in _drain(pages, len(accounts)):
+                    rows = page_rows(account, page, decisions)
+                    writer.write(rows)
+                    written += len(rows)
+            except BaseException:
+                cancelled.set()
+                raise
+            # raises the first error from the fetching threads, if any
+            for future in futures:
+                future.result()
+    finally:
+        writer.close()
+    decisions.save()
+    return written
+
+
+def _drain(pages: queue.Queue[tuple[Account, dict | None]], accounts: int) -> Iterator[tuple[Account, dict]]:
+    remaining = accounts
+    while remaining:
+        account, page = pages.get()
+        if page is None:
+            remaining -= 1
+            logger.debug("Finished fetching the inventory of %s", account.username)
+            continue
+        yield account, page
@@ -1,67 +1,43 @@
 from __future__ import annotations
 
 from functools import cached_property
+from typing import TYPE_CHECKING
 
-import requests
+from .datatypes import Item, SteamURL
+from .utils import create_session, parse_inventory
 
-from .datatypes import ItemExterior, Item, ItemType
+if TYPE_CHECKING:
+    from typing import Iterator
+    from .decisions import DecisionCache
 
 
 class Inventory:
-    def __init__(self, steam_id64: int) -> None:
+    def __init__(self, steam_id64: int, decisions: DecisionCache | None = None) -> None:
         self.steam_id64: int = steam_id64
+        self.decisions: DecisionCache | None = decisions
+        self._session = create_session()
+
+    def pages(self) -> Iterator[dict]:
+        """Yields the raw inventory, one page (of up to 5000 assets) at a time."""
+        params = {"l": "english", "count": 5000}
+        while True:
+            resp = self._session.get(f"{SteamURL.COMMUNITY}/inventory/{self.steam_id64}/730/2", params=params).json()
+            yield resp
+            if not resp.get("more_items"):
+                return
+            params["start_assetid"] = resp["last_assetid"]
 
     @cached_property
     def items(self) -> list[Item]:
-        resp = requests.get(f"https://steamcommunity.com/inventory/{self.steam_id64}/730/2?l=english&count=5000").json()
-        assets: dict = resp["assets"]
-        descriptions: dict = resp["descriptions"]
-
         items: list[Item] = []
-
-        for asset in assets:
-            # ex. {'appid': 730, 'contextid': '2', 'assetid': '23603986921', 'classid': '4593998508', 'instanceid':
-            # '519977179', 'amount': '1'}
-            classid = asset["classid"]
-            description = next((x for x in descriptions if x["classid"] == classid), None)
-            # this means that the item isn't currently tradable.
-            # sometimes the item will never be tradable and other times it will be tradable after 7 days.
-            if description["tradable"] == 0:
-                continue
-
-            type_values = [x.value for x in ItemType]
-            # there may be better ways to parse this.
-            exterior_value: list[str] = [
-                x["value"] for x in description["descriptions"] if x["value"].startswith("Exterior: ")
-            ]
-            type_value: list[str] = [x["localized_tag_name"] for x in description["tags"] if x["category"] == "Type"]
-
-            raw_exterior: str = exterior_value[0].split("Exterior: ")[-1] if exterior_value else None
-            raw_type: str = type_value[0] if type_value and type_value[0] in type_values else None
-
-            name = description["name"]
-            # right now, only csgo is supported so these are hard coded
-            appid = 730
-            contextid = "2"
-            amount = int(asset["amount"])
-            assetid = asset["assetid"]
-            # optionals
-            item_exterior = ItemExterior(raw_exterior) if raw_exterior else None
-            item_type = ItemType(raw_type) if raw_type else None
-
-            items.append(
-                Item(
-                    name=name,
-                    appid=appid,
-                    contextid=contextid,
-                    amount=amount,
-                    assetid=assetid,
-                    exterior=item_exterior,
-                    type=item_type,
-                )
-            )
+        for page in self.pages():
+            items.extend(parse_inventory(page, self.decisions))
+        if self.decisions:
+            self.decisions.save()
         return items
 
     @cached_property
     def items_to_trade(self):
+        if self.decisions:
+            return [item for item in self.items if self.decisions.should_be_traded(item)]
         return [item for item in self.items if item.should_be_traded]
@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+
+from . import cache
+
+if TYPE_CHECKING:
+    import pathlib
+
+logger = logging.getLogger(__name__)
+
+
+# compared by identity, so that `trades.index` finds the trade itself rather than an identical one planned before it
+@dataclass(eq=False)
+class JournaledTrade:
+    partner: str
+    assets: list[str]
+    # unix time the offer was planned
+    timestamp: float
+    trade_id: int | None = None
+    confirmed: bool = False
+    accepted: bool = False
+
+
+@dataclass
+class RunJournal:
+    """
+    Append-only record of the trades made during a run.
+
+    Every step (planned, sent, confirmed, accepted) is flushed to disk before the next one starts,
+    so if a run is interrupted the next one can pick up where it left off instead of sending duplicate offers.
+    The journal is removed once a run finishes.
+    """
+
+    path: pathlib.Path | None
+    trades: list[JournaledTrade] = field(default_factory=list)
+
+    @classmethod
+    def open(cls, account_name: str) -> RunJournal:
+        journal = cls(cache.cache_file(f"{account_name}.journal"))
+        journal._replay()
+        if journal.trades:
+            logger.info("Resuming an interrupted run with %d trade offer(s).", len(journal.trades))
+        return journal
+
+    @property
+    def committed_assets(self) -> set[str]:
+        """Assets that are part of an offer that was already sent"""
+        return {asset for trade in self.trades if trade.trade_id for asset in trade.assets}
+
+    @property
+    def unsent(self) -> list[JournaledTrade]:
+        """Offers that were planned but never recorded as sent"""
+        return [trade for trade in self.trades if not trade.trade_id]
+
+    @property
+    def unfinished(self) -> list[JournaledTrade]:
+        """Offers that were sent but not confirmed or accepted"""
+        return [trade for trade in self.trades if trade.trade_id and not (trade.confirmed and trade.accepted)]
+
+    def planned(self, partner: str, assets: list[str]) -> JournaledTrade:
+        trade = JournaledTrade(partner=partner, assets=[str(asset) for asset in assets], timestamp=time.time())
+        self.trades.append(trade)
+        self._append({"step": "planned", "partner": partner, "assets": trade.assets, "timestamp": trade.timestamp})
+        return trade
+
+    def sent(self, trade: JournaledTrade, trade_id: int) -> None:
+        trade.trade_id = trade_id
+        self._append({"step": "sent", "index": self.trades.index(trade), "trade_id": trade_id})
+
+    def confirmed(self, trade: JournaledTrade) -> None:
+        trade.confirmed = True
+        self._append({"step": "confirmed", "trade_id": trade.trade_id})
+
+    def accepted(self, trade: JournaledTrade) -> None:
+        trade.accepted = True
+        self._append({"step": "accepted", "trade_id": trade.trade_id})
+
+    def finish(self) -> None:
+        self.trades.clear()
+        if self.path and self.path.exists():
+            self.path.unlink()
+
+    def _append(self, entry: dict) -> None:
+        if not self.path:
+            return
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write(json.dumps(entry) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+
+    def _replay(self) -> None:
+        if not self.path or not self.path.exists():
+            return
+        by_trade_id: dict[int, JournaledTrade] = {}
+        with open(self.path, encoding="utf-8") as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # the last line may be cut off if the process died mid-write
+                    logger.debug("Skipping a corrupt journal entry.")
+                    continue
+                step = entry["step"]
+                if step == "planned":
+                    self.trades.append(JournaledTrade(entry["partner"], entry["assets"], entry["timestamp"]))
+                elif step == "sent":
+                    trade = self.trades[entry["index"]]
+                    trade.trade_id = entry["trade_id"]
+                    by_trade_id[trade.trade_id] = trade
+                elif step == "confirmed":
+                    by_trade_id[entry["trade_id"]].confirmed = True
+                elif step == "accepted":
+                    by_trade_id[entry["trade_id"]].accepted = True
@@ -0,0 +1,528 @@
+"""
+Load test for the full trade pipeline.
+
+Runs `SteamInventoryManager` against a local fake steam server with a synthetic inventory and price table,
+then reports the throughput, tail latency, and peak memory of each phase.
+Sending, confirming, and accepting trade offers are reported separately (trade, confirm, accept).
+With `--export`, every inventory is then exported (export). With `--async`, every account logs in again with
+`AsyncAccount`s sharing one connector, and the main inventory is fetched with `AsyncInventory` (async-login, async-fetch).
+The concurrency settings (`--login-workers`, `--fetch-workers`, `--connector-limit`, `--connector-limit-per-host`) can be
+varied to find where throughput stops scaling.
+
+usage: python -m steam-inventory-manager.loadtest --assets 50000 --latency 0.05 --rate-limit 0.01
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import base64
+import http.server
+import json
+import math
+import os
+import random
+import re
+import secrets
+import tempfile
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from http.cookies import SimpleCookie
+from typing import TYPE_CHECKING
+from urllib.parse import parse_qs, urlparse
+
+import rsa
+import yaml
+
+if TYPE_CHECKING:
+    from typing import Callable, ContextManager, Iterator
+
+WEAPON_TYPES = ["Knife", "Gloves", "Pistol", "Rifle", "Sniper Rifle", "Shotgun", "SMG", "Machinegun"]
+OTHER_TYPES = ["Graffiti", "Sticker", "Agent", "Container", "Collectible", "Patch"]
+EXTERIORS = ["Factory New", "Minimal Wear", "Field-Tested", "Well-Worn", "Battle-Scarred"]
+FIRST_STEAM_ID64 = 76561198000000000
+
+
+# synthetic data
+
+
+@dataclass
+class SyntheticInventory:
+    assets: list[dict]
+    descriptions: dict[str, dict]
+    prices: dict[str, float]
+
+
+def generate_inventory(assets: int, unique: int, rng: random.Random) -> SyntheticInventory:
+    """
+    Generates an inventory where a few descriptions are shared by most assets (like stacks of cases and graffiti),
+    with a price table that prices most of them.
+    """
+    descriptions: dict[str, dict] = {}
+    prices: dict[str, float] = {}
+    for index in range(unique):
+        # cheap, stackable items are far more common than weapons
+        item_type = rng.choice(OTHER_TYPES * 3 + WEAPON_TYPES)
+        name = f"Synthetic {item_type} | #{index}"
+        market_name = name
+        lines: list[dict] = []
+        if item_type in WEAPON_TYPES:
+            exterior = rng.choice(EXTERIORS)
+            lines.append({"type": "html", "value": f"Exterior: {exterior}"})
+            market_name = f"{name} ({exterior})"
+        classid = str(1_000_000 + index)
+        descriptions[classid] = {
+            "appid": 730,
+            "classid": classid,
+            "instanceid": "0",
+            "name": name,
+            "market_hash_name": market_name,
+            "tradable": 0 if rng.random() < 0.05 else 1,
+            "descriptions": lines,
+            "tags": [{"category": "Type", "localized_tag_name": item_type}],
+        }
+        # most items are cheap and a few are worth a lot. some aren't priced at all.
+        if rng.random() < 0.9:
+            prices[market_name] = round(rng.lognormvariate(-1, 1.5), 2)
+
+    classids = list(descriptions)
+    weights = [1 / rank for rank in range(1, unique + 1)]
+    picks = rng.choices(classids, weights=weights, k=assets)
+    asset_list = [
+        {
+            "appid": 730,
+            "contextid": "2",
+            "assetid": str(20_000_000_000 + index),
+            "classid": classid,
+            "instanceid": "0",
+            "amount": "1",
+        }
+        for index, classid in enumerate(picks)
+    ]
+    return SyntheticInventory(asset_list, descriptions, prices)
+
+
+def generate_config(alternates: int, min_price: float) -> dict:
+    def account(username: str) -> dict:
+        return {
+            "username": username,
+            "password": "password",
+            "shared-secret": base64.b64encode(secrets.token_bytes(20)).decode(),
+            "identity-secret": base64.b64encode(secrets.token_bytes(20)).decode(),
+        }
+
+    alternate_accounts = []
+    for index in range(alternates):
+        alternate = account(f"loadtest-alternate-{index}")
+        # spread the item types between the alternate accounts
+        alternate["priorities"] = (WEAPON_TYPES + OTHER_TYPES)[index::alternates]
+        alternate_accounts.append(alternate)
+
+    return {
+        "main-account": account("loadtest-main"),
+        "alternate-accounts": alternate_accounts,
+        "options": {
+            "min-price": min_price,
+            "auto-accept-trades": True,
+            "always-trade-graffities": True,
+            "always-trade-stickers": False,
+            "always-trade-agents": False,
+            "always-trade-containers": True,
+            "always-trade-collectibles": False,
+            "always-trade-patches": False,
+            "log-level": "WARNING",
+        },
+    }
+
+
+# fake steam
+
+
+@dataclass
+class Faults:
+    # mean seconds added to every request
+    latency: float = 0.0
+    # chance of answering with 429 Too Many Requests
+    rate_limit: float = 0.0
+    # chance of answering with 500 Internal Server Error
+    failure: float = 0.0
+
+
+@dataclass
+class Offer:
+    sender: int
+    assets: list[dict]
+    created: int
+    confirmed: bool = False
+    accepted: bool = False
+
+    @property
+    def state(self) -> int:
+        # ETradeOfferState: Accepted, Active, CreatedNeedsConfirmation
+        return 3 if self.accepted else 2 if self.confirmed else 9
+
+
+class FakeSteam(http.server.ThreadingHTTPServer):
+    """Answers the steam endpoints used by the pipeline, with injected latency and failures."""
+
+    daemon_threads = True
+
+    def __init__(self, inventory: SyntheticInventory, main_username: str, faults: Faults, page_size: int) -> None:
+        super().__init__(("127.0.0.1", 0), FakeSteamHandler)
+        self.inventory = inventory
+        self.main_username = main_username
+        self.faults = faults
+        self.page_size = page_size
+        self.public_key, _ = rsa.newkeys(512)
+        self.phase = "setup"
+        # (phase, endpoint, status, seconds)
+        self.requests: list[tuple[str, str, int, float]] = []
+        self._lock = threading.Lock()
+        self._steam_ids: dict[str, int] = {}
+        self._offers: dict[int, Offer] = {}
+        self._asset_index = {asset["assetid"]: index for index, asset in enumerate(inventory.assets)}
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def record(self, endpoint: str, status: int, seconds: float) -> None:
+        with self._lock:
+            self.requests.append((self.phase, endpoint, status, seconds))
+
+    def respond(self, method: str, path: str, params: dict[str, str], steam_id64: int | None) -> tuple[int, str]:
+        if self.faults.latency:
+            time.sleep(random.expovariate(1 / self.faults.latency))
+        roll = random.random()
+        if roll < self.faults.rate_limit:
+            return 429, "Too Many Requests"
+        if roll < self.faults.rate_limit + self.faults.failure:
+            return 500, "<html>Internal Server Error</html>"
+
+        if path == "/login/getrsakey/":
+            return 200, json.dumps(
+                {
+                    "success": True,
+                    "publickey_mod": format(self.public_key.n, "x"),
+                    "publickey_exp": format(self.public_key.e, "x"),
+                    "timestamp": str(int(time.time())),
+                }
+            )
+        if path == "/login/dologin/":
+            with self._lock:
+                steam_id64 = self._steam_ids.setdefault(params["username"], FIRST_STEAM_ID64 + len(self._steam_ids))
+            return 200, json.dumps(
+                {"success": True, "login_complete": True, "transfer_parameters": {"steamid": str(steam_id64)}}
+            )
+        if path == "/my/profile":
+            return 200, "<html>profile</html>"
+        if path.endswith("/tradeoffers/privacy"):
+            value = f"https://steamcommunity.com/tradeoffer/new/?partner=1&token={secrets.token_hex(4)}"
+            return 200, f'<html><input id="trade_offer_access_url" value="{value}"></html>'
+        if path == "/dev/apikey":
+            return 200, f'<html><div id="bodyContents_ex"><p>Key: KEY{steam_id64}</p></div></html>'
+        if path == "/tradeoffer/new/send":
+            assets = json.loads(params["json_tradeoffer"])["me"]["assets"]
+            with self._lock:
+                trade_id = len(self._offers) + 1
+                self._offers[trade_id] = Offer(sender=steam_id64, assets=assets, created=int(time.time()))
+            return 200, json.dumps({"tradeofferid": str(trade_id), "needs_mobile_confirmation": True})
+        if re.fullmatch(r"/tradeoffer/\d+/accept", path):
+            self._offers[int(path.split("/")[2])].accepted = True
+            return 200, json.dumps({"tradeid": path.split("/")[2]})
+        if path == "/mobileconf/conf":
+            pending = [
+                trade_id
+                for trade_id, offer in list(self._offers.items())
+                if offer.sender == int(params["a"]) and not offer.confirmed
+            ]
+            if not pending:
+                return 200, '<html><div id="mobileconf_empty"></div></html>'
+            entries = "".join(
+                f'<div class="mobileconf_list_entry" id="conf{trade_id}" data-confid="{trade_id}" '
+                f'data-key="{trade_id}" data-creator="{trade_id}"></div>'
+                for trade_id in pending
+            )
+            return 200, f'<html><div id="mobileconf_list">{entries}</div></html>'
+        if path == "/mobileconf/ajaxop":
+            self._offers[int(params["cid"])].confirmed = True
+            return 200, json.dumps({"success": True})
+        if re.fullmatch(r"/inventory/\d+/730/2", path):
+            return 200, json.dumps(self._inventory_page(int(path.split("/")[2]), params))
+        if path == "/IEconService/GetTradeOffers/v1/":
+            sender = int(params["key"][len("KEY") :])
+            offers = [
+                {
+                    "tradeofferid": str(trade_id),
+                    "trade_offer_state": offer.state,
+                    "items_to_give": offer.assets,
+                    "time_created": offer.created,
+                }
+                for trade_id, offer in list(self._offers.items())
+                if offer.sender == sender
+            ]
+            return 200, json.dumps({"response": {"trade_offers_sent": offers, "next_cursor": 0}})
+        if path == "/ITwoFactorService/QueryTime/v0001":
+            return 200, json.dumps({"response": {"server_time": str(int(time.time()))}})
+        return 404, "Not Found"
+
+    def _inventory_page(self, steam_id64: int, params: dict[str, str]) -> dict:
+        if self._steam_ids.get(self.main_username) != steam_id64:
+            return {"assets": [], "descriptions": [], "total_inventory_count": 0, "success": 1}
+        start = self._asset_index[params["start_assetid"]] + 1 if "start_assetid" in params else 0
+        count = min(int(params.get("count", self.page_size)), self.page_size)
+        assets = self.inventory.assets[start : start + count]
+        # like steam, only the descriptions used on this page are included
+        classids = {asset["classid"] for asset in assets}
+        page = {
+            "assets": assets,
+            "descriptions": [self.inventory.descriptions[classid] for classid in classids],
+            "total_inventory_count": len(self.inventory.assets),
+            "success": 1,
+        }
+        if start + count < len(self.inventory.assets):
+            page["more_items"] = 1
+            page["last_assetid"] = assets[-1]["assetid"]
+        return page
+
+
+class FakeSteamHandler(http.server.BaseHTTPRequestHandler):
+    server: FakeSteam
+    # keep-alive, so that pooled connections are reused like they would be with steam
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        self._handle("GET")
+
+    def do_POST(self) -> None:
+        self._handle("POST")
+
+    def log_message(self, *_) -> None:
+        pass
+
+    def _handle(self, method: str) -> None:
+        started = time.perf_counter()
+        url = urlparse(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length).decode() if length else ""
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        params.update({key: values[0] for key, values in parse_qs(body).items()})
+
+        cookies = SimpleCookie(self.headers.get("Cookie", ""))
+        steam_id64 = int(cookies["steamLoginSecure"].value.split("%7C")[0]) if "steamLoginSecure" in cookies else None
+
+        status, text = self.server.respond(method, url.path, params, steam_id64)
+        data = text.encode()
+        self.send_response(status)
+        if url.path == "/login/dologin/" and status == 200:
+            steam_id = json.loads(text)["transfer_parameters"]["steamid"]
+            self.send_header("Set-Cookie", f"steamLoginSecure={steam_id}%7C%7C{secrets.token_hex(8)}; Path=/")
+        self.send_header("Content-Type", "application/json" if text.startswith("{") else "text/html")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        self.server.record(re.sub(r"\d+", "{id}", url.path), status, time.perf_counter() - started)
+
+
+# measuring
+
+
+@dataclass
+class PhaseResult:
+    name: str
+    seconds: float = 0.0
+    peak_memory: int = 0
+    latencies: list[float] = field(default_factory=list)
+    errors: int = 0
+
+    @property
+    def requests(self) -> int:
+        return len(self.latencies)
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def report(results: dict[str, PhaseResult], assets: int) -> None:
+    header = (
+        f"{'phase':<12} {'seconds':>9} {'requests':>9} {'req/s':>8} {'assets/s':>10} "
+        f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'errors':>7} {'peak MB':>8}"
+    )
+    print(header)
+    print("-" * len(header))
+    for result in results.values():
+        seconds = result.seconds or float("nan")
+        print(
+            f"{result.name:<12} {result.seconds:>9.3f} {result.requests:>9} {result.requests / seconds:>8.1f} "
+            f"{assets / seconds:>10.0f} "
+            f"{percentile(result.latencies, 50) * 1000:>8.1f} {percentile(result.latencies, 95) * 1000:>8.1f} "
+            f"{percentile(result.latencies, 99) * 1000:>8.1f} {max(result.latencies, default=0) * 1000:>8.1f} "
+            f"{result.errors:>7} {result.peak_memory / 1024 / 1024:>8.1f}"
+        )
+
+
+def run_async(args: argparse.Namespace, config: dict, phase: Callable[[str], ContextManager]) -> None:
+    """Logs in to every account again with `AsyncAccount`s sharing one connector, then fetches the main inventory."""
+    import aiohttp
+
+    from .async_account import AsyncAccount, create_connector
+    from .async_inventory import AsyncInventory
+    from .scheduler import LoginScheduler
+
+    async def main() -> None:
+        connector = create_connector(args.connector_limit, args.connector_limit_per_host)
+        accounts = [
+            AsyncAccount(
+                account["username"],
+                account["password"],
+                shared_secret=account["shared-secret"],
+                identity_secret=account["identity-secret"],
+                connector=connector,
+                # aiohttp's default jar refuses cookies from IP addresses, like the fake server's
+                cookie_jar=aiohttp.CookieJar(unsafe=True),
+            )
+            for account in [config["main-account"], *config["alternate-accounts"]]
+        ]
+        try:
+            with phase("async-login"):
+                await LoginScheduler().async_login_all(accounts)
+            with phase("async-fetch"):
+                main_account = accounts[0]
+                async for _ in AsyncInventory(main_account.steam_id64, main_account.session).pages():
+                    pass
+        finally:
+            for account in accounts:
+                await account.close()
+            await connector.close()
+
+    asyncio.run(main())
+
+
+def run(args: argparse.Namespace) -> None:
+    rng = random.Random(args.seed)
+    random.seed(args.seed)
+    inventory = generate_inventory(args.assets, args.unique or max(1, args.assets // 20), rng)
+    config = generate_config(args.alternates, args.min_price)
+    config["options"]["log-level"] = args.log_level
+
+    # everything the run writes (sessions, journal, caches) stays in a throwaway directory
+    directory = tempfile.mkdtemp(prefix="steam-inventory-manager-loadtest-")
+    config_file = os.path.join(directory, "config.yaml")
+    with open(config_file, "w", encoding="utf-8") as file:
+        yaml.safe_dump(config, file)
+    os.environ["STEAM_INVENTORY_MANAGER_CONFIG"] = config_file
+    os.environ["STEAM_INVENTORY_MANAGER_CACHE"] = os.path.join(directory, "cache")
+
+    # imported only now, as importing the config loads config.yaml
+    from . import prices
+    from .datatypes import SteamURL
+    from .decisions import DecisionCache
+    from .export import export_inventories
+    from .logger import setup
+    from .manager import SteamInventoryManager
+
+    class SyntheticPrices(prices.PriceProvider):
+        name = "synthetic"
+        ttl = 0
+
+        def fetch(self) -> dict[str, float]:
+            return inventory.prices
+
+    setup(level=args.log_level)
+    prices.use([SyntheticPrices()])
+
+    faults = Faults(latency=args.latency, rate_limit=args.rate_limit, failure=args.failure)
+    server = FakeSteam(inventory, config["main-account"]["username"], faults, args.page_size)
+    threading.Thread(target=server.serve_forever, name="fake-steam", daemon=True).start()
+    SteamURL.COMMUNITY = SteamURL.API = server.url
+
+    results: dict[str, PhaseResult] = {}
+
+    @contextmanager
+    def phase(name: str) -> Iterator[None]:
+        server.phase = name
+        first_request = len(server.requests)
+        tracemalloc.reset_peak()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            result = results.setdefault(name, PhaseResult(name))
+            result.seconds += time.perf_counter() - started
+            result.peak_memory = max(result.peak_memory, tracemalloc.get_traced_memory()[1])
+            for _, _, status, seconds in server.requests[first_request:]:
+                result.latencies.append(seconds)
+                result.errors += status >= 400
+
+    print(
+        f"{len(inventory.assets)} assets, {len(inventory.descriptions)} descriptions, {args.alternates} alternate "
+        f"accounts, fake steam at {server.url}"
+    )
+    tracemalloc.start()
+    manager = None
+    try:
+        with phase("login"):
+            manager = SteamInventoryManager()
+            manager.scheduler.max_workers = args.login_workers
+        manager.main(phase)
+        if args.export:
+            with phase("export"):
+                export_inventories(
+                    [manager.main_account, *manager.alternate_accounts],
+                    DecisionCache.open(),
+                    os.path.join(directory, "export.csv"),
+                    max_workers=args.fetch_workers,
+                )
+        if args.run_async:
+            # a cache of their own, so the async accounts log in fully instead of reusing the sessions stored above
+            os.environ["STEAM_INVENTORY_MANAGER_CACHE"] = os.path.join(directory, "async-cache")
+            run_async(args, config, phase)
+    except Exception as e:
+        print(f"run failed during {server.phase}: {e!r}")
+    finally:
+        tracemalloc.stop()
+        if manager:
+            manager.scheduler.stop()
+        server.shutdown()
+    report(results, len(inventory.assets))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--assets", type=int, default=10_000, help="number of assets in the main inventory")
+    parser.add_argument("--unique", type=int, help="number of unique descriptions (default: assets / 20)")
+    parser.add_argument("--alternates", type=int, default=3, help="number of alternate accounts")
+    parser.add_argument("--page-size", type=int, default=5000, help="assets per inventory page")
+    parser.add_argument("--min-price", type=float, default=1.0)
+    parser.add_argument("--latency", type=float, default=0.0, help="mean seconds of latency added per request")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="chance of a 429 response")
+    parser.add_argument("--failure", type=float, default=0.0, help="chance of a 500 response")
+    parser.add_argument("--login-workers", type=int, default=16, help="accounts logged in to at once")
+    parser.add_argument(
+        "--fetch-workers", type=int, default=16, help="inventories fetched at once while exporting (with --export)"
+    )
+    parser.add_argument(
+        "--connector-limit", type=int, default=100, help="connections shared by the async accounts (with --async)"
+    )
+    parser.add_argument(
+        "--connector-limit-per-host", type=int, default=10, help="async connections per host (with --async)"
+    )
+    parser.add_argument("--export", action="store_true", help="export every inventory after trading")
+    parser.add_argument(
+        "--async", dest="run_async", action="store_true", help="log in and fetch again with the async client"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--log-level", default="WARNING")
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
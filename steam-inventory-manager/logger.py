@@ -1,12 +1,39 @@
 from __future__ import annotations
 
+import atexit
+import datetime
+import json
 import logging
+import queue
 import sys
 from logging import DEBUG, INFO, WARNING, ERROR, CRITICAL
+from logging.handlers import QueueHandler, QueueListener
+from typing import TYPE_CHECKING
 
 import colorama
 from colorama import Fore, Style
 
+if TYPE_CHECKING:
+    from typing import Any, Callable, TextIO
+
+# attributes every LogRecord has. anything else was passed with `extra=` and is included in json output.
+RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class Lazy:
+    """
+    Defers building a log argument until the record is formatted.
+    (ex. `logger.info("Items: %s", Lazy(lambda names=names: ", ".join(names)))`)
+    Records are formatted later, on the listener's thread, so bind anything that may change (like loop variables)
+    as a default argument.
+    """
+
+    def __init__(self, func: Callable[[], Any]) -> None:
+        self.func = func
+
+    def __str__(self) -> str:
+        return str(self.func())
+
 
 class ColoredFormatter(logging.Formatter):
     """
@@ -31,12 +58,76 @@ class ColoredFormatter(logging.Formatter):
         return formatter.format(record)
 
 
-def setup() -> None:
+class JSONFormatter(logging.Formatter):
+    """Formats records as one json object per line, for log collectors and other programs."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES and not key.startswith("_"):
+                data[key] = value
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    Queues records without formatting them.
+    The default `QueueHandler` formats each record before queueing it, which would keep that work in the logging thread.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+# what the last call to `setup` installed
+_handler: logging.Handler | None = None
+_listener: QueueListener | None = None
+
+
+def setup(level: int = INFO, json_format: bool = False, background: bool = True, stream: TextIO | None = None) -> None:
+    """
+    Sends log output to stdout.
+
+    `json_format` writes json lines instead of colored text.
+    `background` hands records to a thread which formats and writes them, so slow output doesn't hold up the caller.
+    Calling it again (ex. after the config is reloaded) replaces the previous output.
+    """
+    global _handler, _listener
     colorama.init(autoreset=True)
 
-    logging.root.setLevel(INFO)
+    if _handler:
+        logging.root.removeHandler(_handler)
+        _handler = None
+    if _listener:
+        # writes out anything still queued first
+        _listener.stop()
+        atexit.unregister(_listener.stop)
+        _listener = None
+
+    logging.root.setLevel(level)
+
+    _stream_handler = logging.StreamHandler(stream=stream or sys.stdout)
+    if json_format:
+        _stream_handler.setFormatter(JSONFormatter())
+    else:
+        _stream_handler.setFormatter(ColoredFormatter(fmt="[%(levelname)s]: %(message)s"))
 
-    _stream_handler = logging.StreamHandler(stream=sys.stdout)
-    _stream_handler.setFormatter(ColoredFormatter(fmt="[%(levelname)s]: %(message)s"))
+    if not background:
+        _handler = _stream_handler
+        logging.root.addHandler(_handler)
+        return
 
-    logging.root.addHandler(_stream_handler)
+    records: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+    _listener = QueueListener(records, _stream_handler, respect_handler_level=True)
+    _listener.start()
+    # flushes anything still queued on exit
+    atexit.register(_listener.stop)
+    _handler = DeferredQueueHandler(records)
+    logging.root.addHandler(_handler)
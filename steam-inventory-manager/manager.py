@@ -0,0 +1,407 @@
+from __future__ import annotations
+
+import logging
+import threading
+from collections import defaultdict
+from contextlib import nullcontext
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+import requests
+
+from . import config, prices
+from .account import Account
+from .exceptions import SteamInventoryManagerError, TradeError
+from .datatypes import TradeOfferState
+from .decisions import DecisionCache
+from .export import export_inventories
+from .inventory import Inventory
+from .journal import JournaledTrade, RunJournal
+from .logger import Lazy, setup
+from .scheduler import LoginScheduler
+from .tracker import TradeOfferTracker
+
+if TYPE_CHECKING:
+    from typing import Callable, ContextManager
+    from typing import Mapping
+    from .config import AccountConfig, Configuration
+    from .datatypes import ItemType, Item
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SentOffer:
+    partner: Account
+    trade_id: int
+    journaled: JournaledTrade
+
+
+class SteamInventoryManager:
+    def __init__(self):
+        self.scheduler = LoginScheduler()
+        self.tracker = TradeOfferTracker()
+        self.inventory: Inventory | None = None
+        self.journal: RunJournal | None = None
+        # assets that were already traded again after their first offer failed
+        self._retraded_assets: set[str] = set()
+
+        self.main_account: Account | None = None
+        self._main_account_config: AccountConfig | None = None
+        self.alternate_accounts: list[Account] = []
+        self._alternate_accounts_by_name: dict[str, Account] = {}
+        # the priorities of the config the accounts were built from
+        self._priorities: Mapping[ItemType, str] = {}
+        # raises ConfigurationError before anything is logged in to, if config.yaml is invalid
+        self._build_accounts(config.current())
+
+    def _build_accounts(self, settings: Configuration) -> None:
+        """
+        Builds the accounts of a (re)loaded config.
+        Accounts whose credentials didn't change are kept as they are, so they stay logged in.
+        """
+        existing = {acc.username: acc for acc in [self.main_account, *self.alternate_accounts] if acc}
+
+        def build(account_config: AccountConfig) -> Account:
+            acc = existing.pop(account_config.username, None)
+            if acc and (acc.password, acc.shared_secret, acc.identity_secret) == (
+                account_config.password,
+                account_config.shared_secret,
+                account_config.identity_secret,
+            ):
+                acc.priorities = list(account_config.priorities)
+                return acc
+            return Account(
+                username=account_config.username,
+                password=account_config.password,
+                shared_secret=account_config.shared_secret,
+                identity_secret=account_config.identity_secret,
+                priorities=list(account_config.priorities),
+            )
+
+        main_account_config = settings.main_account
+        if self.inventory is not None and main_account_config != self._main_account_config:
+            # the inventory and journal of this run belong to the main account it started with
+            logger.warning("Changes to main-account apply from the next run.")
+            main_account_config = self._main_account_config
+        self.main_account = build(main_account_config)
+        self._main_account_config = main_account_config
+        self.alternate_accounts = [build(account_config) for account_config in settings.alternate_accounts]
+        self._alternate_accounts_by_name = {acc.username: acc for acc in self.alternate_accounts}
+        self._priorities = settings.priorities
+        # accounts that were removed (or whose credentials changed) no longer need their sessions refreshed
+        for acc in existing.values():
+            self.scheduler.forget(acc)
+
+    def reload_config(self) -> bool:
+        """
+        Applies any changes made to config.yaml since it was last loaded. Returns whether there were any.
+        Changed accounts are rebuilt (and logged in to right away if the run already has), and changed price providers
+        are reloaded.
+        """
+        previous = config.current()
+        if not config.reload():
+            return False
+        settings = config.current()
+        self._build_accounts(settings)
+        if self.inventory is not None:
+            self.scheduler.login_all([acc for acc in self.alternate_accounts if not acc.logged_in])
+        if settings.options.price_providers != previous.options.price_providers:
+            prices.forget()
+        if (settings.options.log_level, settings.options.log_format) != (
+            previous.options.log_level,
+            previous.options.log_format,
+        ):
+            setup(level=settings.options.log_level, json_format=settings.options.log_format == "json")
+        return True
+
+    @property
+    def auto_accept_trades(self) -> bool:
+        return config.current().options.auto_accept_trades
+
+    def login(self) -> None:
+        self.scheduler.login_all([self.main_account, *self.alternate_accounts])
+        # keeps the sessions fresh for as long as the script is running
+        self.scheduler.start()
+
+        self.inventory = Inventory(self.main_account.steam_id64, DecisionCache.open())
+        self.journal = RunJournal.open(self.main_account.username)
+
+    def export(
+        self, path: str, output_format: str | None = None, phase: Callable[[str], ContextManager] = nullcontext
+    ) -> None:
+        """Writes every asset of every account to `path`, along with its price and trade decision."""
+        self.reload_config()
+        accounts = [self.main_account, *self.alternate_accounts]
+        with phase("login"):
+            self.scheduler.login_all(accounts)
+
+        with phase("prices"):
+            prices.prices()
+
+        with phase("export"):
+            rows = export_inventories(accounts, DecisionCache.open(), path, output_format)
+        logger.info("Exported %d asset(s) from %d account(s) to %s", rows, len(accounts), path)
+
+    def which_alternate_account(self, item_type: ItemType):
+        """
+        Finds which account the item should be traded to based on its type.
+        Defaults to the first account in the list
+        """
+        username = self._priorities.get(item_type)
+        if username is None:
+            return self.alternate_accounts[0]
+        acc = self._alternate_accounts_by_name.get(username)
+        if not acc:
+            logger.warning(
+                "%s items are prioritized by %s, which isn't configured. Trading them to %s instead.",
+                item_type.value,
+                username,
+                self.alternate_accounts[0].username,
+            )
+            return self.alternate_accounts[0]
+        return acc
+
+    def items_to_trade(self) -> list[Item]:
+        """Tradable items, minus any that are already part of an offer from an interrupted run."""
+        committed_assets = self.journal.committed_assets
+        return [item for item in self.inventory.items_to_trade if str(item.assetid) not in committed_assets]
+
+    def route(self, items: list[Item]) -> dict[Account, list[Item]]:
+        trade_offers: dict[Account, list[Item]] = defaultdict(list)
+        for item in items:
+            acc = self.which_alternate_account(item.type)
+            trade_offers[acc].append(item)
+        return trade_offers
+
+    def trade(self, trade_offers: dict[Account, list[Item]]) -> None:
+        """Sends, confirms, and (with auto-accept-trades) accepts the trade offers."""
+        sent = self.send_offers(trade_offers)
+        self.confirm_offers(sent)
+        self.accept_offers(sent)
+
+    def send_offers(self, trade_offers: dict[Account, list[Item]]) -> list[SentOffer]:
+        sent: list[SentOffer] = []
+        for acc, items in trade_offers.items():
+            journaled = self.journal.planned(acc.username, [item.assetid for item in items])
+            trade_id = self.main_account.trade(
+                partner=acc,
+                me=[item.trade_asset for item in items],
+                on_sent=lambda sent_id, journaled=journaled: self.journal.sent(journaled, sent_id),
+                confirm=False,
+            )
+            logger.info("Opening trade offer with: %s", acc.username)
+            logger.info("Items being traded: %s", Lazy(lambda items=items: ", ".join(i.market_name for i in items)))
+            self.tracker.track(self.main_account, trade_id, acc, items)
+            sent.append(SentOffer(acc, trade_id, journaled))
+        return sent
+
+    def confirm_offers(self, sent: list[SentOffer]) -> None:
+        for offer in sent:
+            # the main account always gives items, so every offer needs to be confirmed
+            if not self.main_account.confirm_trade(offer.trade_id):
+                raise TradeError(f"No confirmation found for trade {offer.trade_id}.")
+            self.journal.confirmed(offer.journaled)
+
+    def accept_offers(self, sent: list[SentOffer]) -> None:
+        if not self.auto_accept_trades:
+            return
+        for offer in sent:
+            offer.partner.accept_trade(partner=self.main_account, trade_id=offer.trade_id)
+            self.journal.accepted(offer.journaled)
+
+    def track_offers(self, timeout: float, interval: float = 60) -> None:
+        """
+        Follows the sent offers until they've all finished, or for up to `timeout` seconds.
+        Items from offers that fail or expire are routed and traded again, once.
+        """
+        stop = threading.Event()
+        timer = threading.Timer(timeout, stop.set)
+        timer.daemon = True
+        timer.start()
+        logger.info("Tracking %d trade offer(s) for up to %d seconds.", self.tracker.outstanding, timeout)
+        try:
+            self.tracker.run(interval, stop, on_requeued=self._retrade, on_tick=self.reload_config)
+        finally:
+            timer.cancel()
+
+    def _retrade(self, items: list[Item]) -> None:
+        retry = [item for item in items if str(item.assetid) not in self._retraded_assets]
+        if len(retry) < len(items):
+            logger.warning("%d item(s) failed to trade twice, leaving them for the next run.", len(items) - len(retry))
+        if not retry:
+            return
+        self._retraded_assets.update(str(item.assetid) for item in retry)
+        logger.info("Trading %d item(s) from failed trade offers again.", len(retry))
+        try:
+            self.trade(self.route(retry))
+        except (SteamInventoryManagerError, requests.exceptions.RequestException) as e:
+            logger.warning("Failed to trade the items again: %s", e)
+
+    def main(self, phase: Callable[[str], ContextManager] = nullcontext, track_for: float = 0) -> None:
+        """
+        Runs every step, from logging in to trading.
+        Each step is wrapped in `phase(name)`, which can be used to measure it.
+        Changes to config.yaml are applied before every step. (see `reload_config`)
+        With `track_for`, the sent offers are followed for up to that many seconds (see `track_offers`).
+        """
+        # set again once logged in. until then, changes to the main account can still be applied.
+        self.inventory = None
+
+        def step(name: str) -> ContextManager:
+            self.reload_config()
+            return phase(name)
+
+        with step("login"):
+            self.login()
+
+        logger.info("Main account: %s", self.main_account.username)
+
+        for index, acc in enumerate(self.alternate_accounts, start=1):
+            logger.info("Alternate account #%d: %s", index, acc.username)
+
+        logger.info("All accounts logged in!")
+
+        with step("prices"):
+            prices.prices()
+
+        with step("fetch"):
+            self.inventory.items
+
+        with step("filter"):
+            self.resume()
+            items_to_trade = self.items_to_trade()
+
+        if not items_to_trade:
+            logger.critical("Found no items to trade.")
+            self.journal.finish()
+            self.scheduler.stop()
+            return
+
+        with step("route"):
+            trade_offers = self.route(items_to_trade)
+
+        with step("trade"):
+            sent = self.send_offers(trade_offers)
+
+        with step("confirm"):
+            self.confirm_offers(sent)
+
+        with step("accept"):
+            self.accept_offers(sent)
+
+        len_offers = len(trade_offers)
+        len_items = len(items_to_trade)
+        offers_noun = "offers" if len_offers > 1 else "offer"
+        items_noun = "items" if len_items > 1 else "item"
+
+        logger.info("Successfully opened %d trade %s with %d total %s.", len_offers, offers_noun, len_offers, items_noun)
+
+        if track_for:
+            with step("track"):
+                self.track_offers(track_for)
+
+        self.journal.finish()
+        self.report_trade_offers()
+        self.scheduler.stop()
+
+    def resume(self) -> None:
+        """Finishes the trades of an interrupted run."""
+        if self.journal.unsent:
+            self._recover_unsent()
+
+        unfinished = self.journal.unfinished
+        if not unfinished:
+            return
+        # offers may have been accepted, declined, cancelled, or expired while the run was down
+        states = self._offer_states(int(min(journaled.timestamp for journaled in unfinished)) - 60)
+
+        accounts = {acc.username: acc for acc in self.alternate_accounts}
+        for journaled in unfinished:
+            partner = accounts.get(journaled.partner)
+            if not partner:
+                logger.warning(
+                    "Can't resume trade %d, %s is no longer configured.", journaled.trade_id, journaled.partner
+                )
+                continue
+            state = states.get(journaled.trade_id)
+            if state == TradeOfferState.ACCEPTED:
+                if not journaled.confirmed:
+                    self.journal.confirmed(journaled)
+                if not journaled.accepted:
+                    self.journal.accepted(journaled)
+                logger.info("Trade offer with %s was accepted while the run was down.", partner.username)
+                continue
+            if state and state.failed:
+                # failed offers leave their items in the inventory for the next run
+                logger.warning(
+                    "Trade offer %d with %s was %s while the run was down.",
+                    journaled.trade_id,
+                    partner.username,
+                    state.name.lower().replace("_", " "),
+                )
+                continue
+            try:
+                if not journaled.confirmed:
+                    # an active offer was confirmed before the previous run stopped, it just wasn't journaled
+                    if state != TradeOfferState.ACTIVE and not self.main_account.confirm_trade(journaled.trade_id):
+                        logger.warning(
+                            "Can't resume trade %d with %s, it has no pending confirmation.",
+                            journaled.trade_id,
+                            partner.username,
+                        )
+                        continue
+                    self.journal.confirmed(journaled)
+                if self.auto_accept_trades and not journaled.accepted:
+                    partner.accept_trade(partner=self.main_account, trade_id=journaled.trade_id)
+                    self.journal.accepted(journaled)
+            except (SteamInventoryManagerError, requests.exceptions.RequestException) as e:
+                logger.warning("Failed to resume trade %d with %s: %s", journaled.trade_id, partner.username, e)
+                continue
+            assets = set(journaled.assets)
+            items = [item for item in self.inventory.items if str(item.assetid) in assets]
+            self.tracker.track(self.main_account, journaled.trade_id, partner, items)
+            logger.info("Resumed trade offer with: %s", partner.username)
+
+    def _offer_states(self, cutoff: int) -> dict[int, TradeOfferState]:
+        """The states of the main account's offers that are active, or were updated since `cutoff`."""
+        try:
+            offers = self.main_account.trade_offers(time_historical_cutoff=cutoff)
+        except (SteamInventoryManagerError, requests.exceptions.RequestException) as e:
+            logger.warning("Failed to look up the trade offers of the interrupted run: %s", e)
+            return {}
+        return {int(offer["tradeofferid"]): TradeOfferState(offer["trade_offer_state"]) for offer in offers}
+
+    def _recover_unsent(self) -> None:
+        """
+        An offer may have been sent right before the previous run stopped, without it being journaled.
+        Look for it in the main account's offers so that its items aren't offered twice.
+        """
+        cutoff = int(min(journaled.timestamp for journaled in self.journal.unsent)) - 60
+        try:
+            offers = self.main_account.trade_offers(time_historical_cutoff=cutoff)
+        except (SteamInventoryManagerError, requests.exceptions.RequestException) as e:
+            logger.warning("Failed to look up the trade offers of the interrupted run: %s", e)
+            return
+        for journaled in self.journal.unsent:
+            for offer in offers:
+                given = {asset["assetid"] for asset in offer.get("items_to_give", [])}
+                if TradeOfferState(offer["trade_offer_state"]).failed or not given.intersection(journaled.assets):
+                    continue
+                self.journal.sent(journaled, int(offer["tradeofferid"]))
+                break
+
+    def report_trade_offers(self) -> None:
+        try:
+            self.tracker.poll()
+        except (SteamInventoryManagerError, requests.exceptions.RequestException) as e:
+            logger.warning("Failed to check the state of the trade offers: %s", e)
+            return
+        for state, count in self.tracker.finished.items():
+            logger.info("%d trade offer(s) %s.", count, state.name.lower().replace("_", " "))
+        if self.tracker.outstanding:
+            logger.info("%d trade offer(s) still pending.", self.tracker.outstanding)
+        requeued = self.tracker.pop_requeued()
+        if requeued:
+            # they're still in the main account's inventory, and no longer journaled once the run finishes
+            logger.warning("%d item(s) weren't traded. The next run will pick them up again.", len(requeued))
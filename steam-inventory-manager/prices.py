@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import statistics
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import requests
+
+from . import cache, config
+from .profiling import profiled
+
+logger = logging.getLogger(__name__)
+
+
+class PriceProvider(ABC):
+    """
+    A source of item prices.
+
+    Each provider keeps its own on-disk cache, which is reused for `ttl` seconds
+    and used as a fallback (no matter how old) when fetching fails.
+    """
+
+    name: str
+    # seconds
+    ttl: float = 6 * 60 * 60
+
+    @abstractmethod
+    def fetch(self) -> dict[str, float]:
+        """Returns market name -> price in USD."""
+
+    def load(self) -> dict[str, float]:
+        cached = cache.price_data(self.name)
+        if cached and time.time() - cached[0] < self.ttl:
+            logger.debug("Using cached prices from %s.", self.name)
+            return cached[1]
+        try:
+            prices = self.fetch()
+        except (requests.exceptions.RequestException, ValueError, KeyError, TypeError) as e:
+            logger.warning("Failed to fetch prices from %s: %r", self.name, e)
+            return self.stale()
+        cache.store_price_data(self.name, prices)
+        return prices
+
+    def stale(self) -> dict[str, float]:
+        """Returns cached prices regardless of their age."""
+        cached = cache.price_data(self.name)
+        return cached[1] if cached else {}
+
+
+class CSGOBackpack(PriceProvider):
+    name = "csgobackpack"
+
+    def fetch(self) -> dict[str, float]:
+        items = requests.get("https://csgobackpack.net/api/GetItemsList/v2/", timeout=30).json()["items_list"]
+        prices: dict[str, float] = {}
+        for market_name, item in items.items():
+            if "price" not in item:
+                continue
+            # imo median is better then an average because of extreme undercuts
+            # and super high prices skewing the average
+            queue = ("30_days", "all_time", "7_days", "24_hours")
+            for key in queue:
+                if key in item["price"]:
+                    prices[market_name] = item["price"][key]["median"]
+                    break
+        return prices
+
+
+class Skinport(PriceProvider):
+    name = "skinport"
+
+    def fetch(self) -> dict[str, float]:
+        # skinport only serves this endpoint brotli compressed (406 otherwise). requests decodes it with `brotli`.
+        items = requests.get(
+            "https://api.skinport.com/v1/items?app_id=730&currency=USD",
+            headers={"Accept-Encoding": "br"},
+            timeout=30,
+        ).json()
+        return {
+            item["market_hash_name"]: item["median_price"] or item["suggested_price"]
+            for item in items
+            if item.get("median_price") or item.get("suggested_price")
+        }
+
+
+class CSGOTrader(PriceProvider):
+    name = "csgotrader"
+
+    def fetch(self) -> dict[str, float]:
+        items = requests.get("https://prices.csgotrader.app/latest/prices_v6.json", timeout=30).json()
+        prices: dict[str, float] = {}
+        for market_name, item in items.items():
+            steam = item.get("steam") or {}
+            queue = ("last_30d", "last_90d", "last_7d", "last_24h")
+            for key in queue:
+                if steam.get(key):
+                    prices[market_name] = steam[key]
+                    break
+        return prices
+
+
+PROVIDERS: dict[str, type[PriceProvider]] = {
+    CSGOBackpack.name: CSGOBackpack,
+    Skinport.name: Skinport,
+    CSGOTrader.name: CSGOTrader,
+}
+
+
+def merge(price_tables: list[dict[str, float]]) -> dict[str, float]:
+    """
+    Merges the prices from several providers.
+    Items priced by more than one provider get the median of their prices, and gaps in one provider are filled by the
+    others.
+    """
+    collected: dict[str, list[float]] = {}
+    for prices in price_tables:
+        for market_name, price in prices.items():
+            collected.setdefault(market_name, []).append(price)
+    return {market_name: statistics.median(prices) for market_name, prices in collected.items()}
+
+
+def load(providers: list[PriceProvider], timeout: float = 30) -> dict[str, float]:
+    """
+    Loads every provider concurrently and merges the results.
+    Providers that fail, or haven't finished within `timeout` seconds, fall back to their cached prices.
+    """
+    executor = ThreadPoolExecutor(max_workers=len(providers) or 1)
+    futures = {executor.submit(profiled(provider.load)): provider for provider in providers}
+    done, _ = wait(futures, timeout=timeout)
+    # don't wait on providers that are still running
+    executor.shutdown(wait=False)
+
+    price_tables: list[dict[str, float]] = []
+    for future, provider in futures.items():
+        if future in done and not future.exception():
+            price_tables.append(future.result())
+            continue
+        logger.warning("Prices from %s aren't available, using cached prices instead.", provider.name)
+        price_tables.append(provider.stale())
+    return merge(price_tables)
+
+
+def configured_providers() -> list[PriceProvider]:
+    # the names were validated when the config was compiled
+    return [PROVIDERS[name]() for name in config.current().options.price_providers]
+
+
+_providers: list[PriceProvider] | None = None
+_prices: dict[str, float] | None = None
+_version: str | None = None
+
+
+def use(providers: list[PriceProvider]) -> None:
+    """Replaces the configured providers (ex. with local stand-ins) and forgets any loaded prices."""
+    global _providers
+    _providers = providers
+    forget()
+
+
+def forget() -> None:
+    """Forgets the loaded prices, so that they're loaded again (ex. after the configured providers change)."""
+    global _prices, _version
+    _prices = None
+    _version = None
+
+
+def prices() -> dict[str, float]:
+    """Returns the merged prices, loading them on first use."""
+    global _prices
+    if _prices is None:
+        _prices = load(_providers if _providers is not None else configured_providers())
+    return _prices
+
+
+def price(market_name: str) -> float:
+    """Returns the price of an item, or -1 if no provider has a price for it."""
+    return prices().get(market_name, -1)
+
+
+def version() -> str:
+    """Identifies the loaded prices. Changes whenever any price does."""
+    global _version
+    if _version is None:
+        _version = hashlib.sha1(json.dumps(prices(), sort_keys=True).encode()).hexdigest()[:16]
+    return _version
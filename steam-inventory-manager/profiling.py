@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import cProfile
+import functools
+import logging
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, TypeVar
+
+if TYPE_CHECKING:
+    from typing import Callable, Iterator
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# profilers of the worker threads started during the phase that's being profiled, if any
+_worker_profilers: list[cProfile.Profile] | None = None
+_worker_lock = threading.Lock()
+
+
+def profiled(function: Callable[..., T]) -> Callable[..., T]:
+    """
+    Wraps a function that runs on a worker thread, so that its calls are part of the current phase's profile.
+    cProfile only sees the thread it was enabled on, so without this the phase only shows the main thread waiting.
+    Returns the function as is when no phase is being profiled.
+    """
+    collected = _worker_profilers
+    if collected is None:
+        return function
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs) -> T:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # python 3.12+ only allows one active profiler at a time
+            return function(*args, **kwargs)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            profiler.disable()
+            with _worker_lock:
+                collected.append(profiler)
+
+    return wrapper
+
+
+class PhaseProfiler:
+    """
+    Profiles each phase of a run separately. (ex. `manager.main(phase=profiler.phase)`)
+
+    With `profile`, every phase runs under its own cProfile profiler, saved to `{phase}.pstats`.
+    Worker threads are only included if their functions are wrapped with `profiled` (login, prices, and export are).
+    The background session refresher isn't part of any phase, and workers still running once their phase ends are
+    left out.
+    With `trace_memory`, a tracemalloc snapshot is saved to `{phase}.tracemalloc` at the end of every phase.
+    `close` writes a summary of the top hot spots of each phase to `summary.txt` and logs it.
+    Time and profiles of phases that run more than once are accumulated.
+    """
+
+    def __init__(self, directory: str, *, profile: bool = False, trace_memory: bool = False, top: int = 5) -> None:
+        self.directory: str = directory
+        self.profile: bool = profile
+        self.trace_memory: bool = trace_memory
+        self.top: int = top
+        self._stats: dict[str, pstats.Stats] = {}
+        self._seconds: dict[str, float] = {}
+        self._peak_memory: dict[str, int] = {}
+        # memory that was allocated during each phase, and is still allocated after it
+        self._memory_growth: dict[str, list[tracemalloc.StatisticDiff]] = {}
+        self._last_snapshot: tracemalloc.Snapshot | None = None
+
+        if self.enabled:
+            os.makedirs(self.directory, exist_ok=True)
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start(10)
+
+    @property
+    def enabled(self) -> bool:
+        return self.profile or self.trace_memory
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        global _worker_profilers
+        if not self.enabled:
+            yield
+            return
+
+        profiler = cProfile.Profile() if self.profile else None
+        workers: list[cProfile.Profile] = []
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            self._last_snapshot = self._last_snapshot or self._snapshot()
+        started = time.perf_counter()
+        if profiler:
+            _worker_profilers = workers
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler:
+                profiler.disable()
+                _worker_profilers = None
+            self._seconds[name] = self._seconds.get(name, 0) + time.perf_counter() - started
+            if profiler:
+                self._save_stats(name, profiler, workers)
+            if self.trace_memory:
+                self._peak_memory[name] = max(self._peak_memory.get(name, 0), tracemalloc.get_traced_memory()[1])
+                snapshot = self._snapshot()
+                snapshot.dump(os.path.join(self.directory, f"{name}.tracemalloc"))
+                self._memory_growth[name] = snapshot.compare_to(self._last_snapshot, "lineno")
+                self._last_snapshot = snapshot
+
+    def _save_stats(self, name: str, profiler: cProfile.Profile, workers: list[cProfile.Profile]) -> None:
+        stats = pstats.Stats(profiler)
+        # workers that finish after this (ex. a slow price provider) are left out
+        with _worker_lock:
+            finished = list(workers)
+        for worker in finished:
+            stats.add(worker)
+        if name in self._stats:
+            stats.add(self._stats[name])
+        self._stats[name] = stats
+        stats.dump_stats(os.path.join(self.directory, f"{name}.pstats"))
+
+    def close(self) -> None:
+        if not self.enabled or not self._seconds:
+            return
+        summary = self.summary()
+        with open(os.path.join(self.directory, "summary.txt"), "w", encoding="utf-8") as file:
+            file.write(summary + "\n")
+        logger.info("Profiled %d phase(s), saved to %s\n%s", len(self._seconds), self.directory, summary)
+        if self.trace_memory:
+            tracemalloc.stop()
+
+    def summary(self) -> str:
+        lines: list[str] = []
+        for name, seconds in self._seconds.items():
+            lines.append(f"{name}: {seconds:.3f}s")
+            if name in self._stats:
+                lines.append("  hot spots (own time / total time, calls):")
+                lines.extend(f"    {line}" for line in self._hot_spots(self._stats[name]))
+            if name in self._peak_memory:
+                lines.append(f"  peak memory: {self._peak_memory[name] / 1024 / 1024:.1f} MiB")
+                lines.append("  memory growth:")
+                growth = [diff for diff in self._memory_growth[name] if diff.size_diff > 0][: self.top]
+                lines.extend(
+                    f"    {diff.size_diff / 1024:+.1f} KiB ({diff.count_diff:+d} blocks) {diff.traceback[0]}"
+                    for diff in growth
+                )
+        return "\n".join(lines)
+
+    def _hot_spots(self, stats: pstats.Stats) -> list[str]:
+        entries = stats.stats  # type: ignore[attr-defined]
+        # (file, line, function) -> (primitive calls, calls, own time, total time, callers)
+        ranked = sorted(entries.items(), key=lambda item: item[1][2], reverse=True)[: self.top]
+        return [
+            f"{own:.3f}s / {total:.3f}s, {calls}x {pstats.func_std_string(func)}"
+            for func, (_, calls, own, total, _) in ranked
+        ]
+
+    @staticmethod
+    def _snapshot() -> tracemalloc.Snapshot:
+        # the profilers' own allocations aren't interesting
+        return tracemalloc.take_snapshot().filter_traces(
+            (
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, cProfile.__file__),
+                tracemalloc.Filter(False, __file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+            )
+        )
@@ -0,0 +1,209 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
+import requests
+
+from .datatypes import SteamURL
+from .exceptions import SteamInventoryManagerError, TwoFactorCodeInvalid
+from .profiling import profiled
+from .utils import generate_one_time_code
+
+if TYPE_CHECKING:
+    from .account import Account
+    from .async_account import AsyncAccount
+
+logger = logging.getLogger(__name__)
+
+# steam guard codes change every 30 seconds, and each one can only be used once.
+CODE_WINDOW = 30
+
+
+class LoginScheduler:
+    """
+    Schedules logins around Steam Guard code windows.
+
+    The offset between the local clock and steam's is queried once and cached.
+    Logins that need a code are each given their own window, so accounts that share a shared_secret (or retries after
+    `TwoFactorCodeInvalid`) wait for the next window instead of burning the current one.
+    Registered sessions are refreshed in the background once they're older than `max_session_age` or stop working,
+    so the trade path rarely waits on a full login. A refresh and a trade on the same account never overlap.
+    """
+
+    def __init__(
+        self,
+        max_session_age: float = 20 * 60 * 60,
+        refresh_interval: float = 5 * 60,
+        retries: int = 2,
+        max_workers: int = 16,
+    ):
+        self.max_session_age: float = max_session_age
+        self.refresh_interval: float = refresh_interval
+        self.retries: int = retries
+        # how many accounts `login_all` logs in to at once
+        self.max_workers: int = max_workers
+        self._time_offset: float | None = None
+        self._last_windows: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._accounts: list[Account] = []
+        self._async_accounts: list[AsyncAccount] = []
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def time_offset(self) -> float:
+        """Seconds to add to the local clock to get steam's time"""
+        if self._time_offset is None:
+            self._time_offset = self._query_time_offset()
+        return self._time_offset
+
+    def steam_time(self) -> float:
+        return time.time() + self.time_offset
+
+    def resync(self) -> None:
+        """Forgets the cached time offset so that it's queried again on the next login."""
+        self._time_offset = None
+
+    def reserve_window(self, shared_secret: str) -> tuple[int, float]:
+        """
+        Reserves the next unused code window for a shared secret.
+        Returns the timestamp to generate the code with and how many seconds to wait until that window opens.
+        """
+        now = self.steam_time()
+        with self._lock:
+            window = max(int(now // CODE_WINDOW), self._last_windows.get(shared_secret, -1) + 1)
+            self._last_windows[shared_secret] = window
+        timestamp = max(int(now), window * CODE_WINDOW)
+        return timestamp, max(0.0, window * CODE_WINDOW - now)
+
+    # sync accounts
+
+    def login(self, account: Account, *, force: bool = False) -> None:
+        for attempt in range(self.retries + 1):
+            try:
+                account.login(lambda: self._wait_for_code(account.shared_secret), force=force)
+                break
+            except TwoFactorCodeInvalid:
+                if attempt == self.retries:
+                    raise
+                logger.debug("Steam Guard code rejected for %s, retrying in the next window.", account.username)
+                # the clock may have drifted since the offset was cached
+                self.resync()
+        if account not in self._accounts:
+            self._accounts.append(account)
+
+    def login_all(self, accounts: list[Account]) -> None:
+        """Logs in all accounts concurrently. Only accounts sharing a shared_secret wait on each other."""
+        if not accounts:
+            return
+        with ThreadPoolExecutor(max_workers=min(len(accounts), self.max_workers)) as executor:
+            # consume the results so that exceptions are raised here
+            list(executor.map(profiled(self.login), accounts))
+
+    def forget(self, account: Account | AsyncAccount) -> None:
+        """Stops refreshing an account's session."""
+        for accounts in (self._accounts, self._async_accounts):
+            if account in accounts:
+                accounts.remove(account)
+
+    def refresh(self, account: Account) -> None:
+        age = time.time() - (account.session_timestamp or 0)
+        if age < self.max_session_age and account.session_alive():
+            return
+        logger.info("Refreshing session for %s", account.username)
+        self.login(account, force=True)
+
+    def start(self) -> None:
+        """Starts refreshing the sessions of logged in accounts in a background thread."""
+        if self._thread:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._refresh_loop, name="session-refresher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _refresh_loop(self) -> None:
+        while not self._stop.wait(self.refresh_interval):
+            for account in list(self._accounts):
+                if self._stop.is_set():
+                    return
+                try:
+                    self.refresh(account)
+                except (SteamInventoryManagerError, requests.exceptions.RequestException) as e:
+                    logger.warning("Failed to refresh session for %s: %s", account.username, e)
+
+    def _wait_for_code(self, shared_secret: str) -> str:
+        timestamp, delay = self.reserve_window(shared_secret)
+        if delay:
+            logger.debug("Waiting %.1fs for the next Steam Guard code window.", delay)
+            time.sleep(delay)
+        return generate_one_time_code(shared_secret, timestamp)
+
+    # async accounts
+
+    async def async_login(self, account: AsyncAccount, *, force: bool = False) -> None:
+        for attempt in range(self.retries + 1):
+            try:
+                await account.login(lambda: self._async_wait_for_code(account.shared_secret), force=force)
+                break
+            except TwoFactorCodeInvalid:
+                if attempt == self.retries:
+                    raise
+                logger.debug("Steam Guard code rejected for %s, retrying in the next window.", account.username)
+                self.resync()
+        if account not in self._async_accounts:
+            self._async_accounts.append(account)
+
+    async def async_login_all(self, accounts: list[AsyncAccount]) -> None:
+        await asyncio.gather(*(self.async_login(account) for account in accounts))
+
+    async def async_refresh(self, account: AsyncAccount) -> None:
+        age = time.time() - (account.session_timestamp or 0)
+        if age < self.max_session_age and await account.session_alive():
+            return
+        logger.info("Refreshing session for %s", account.username)
+        await self.async_login(account, force=True)
+
+    async def keep_alive(self) -> None:
+        """Refreshes the sessions of logged in async accounts until cancelled."""
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            # accounts may be added or forgotten while refreshing, so the results are matched against this copy
+            accounts = list(self._async_accounts)
+            results = await asyncio.gather(
+                *(self.async_refresh(account) for account in accounts), return_exceptions=True
+            )
+            for account, result in zip(accounts, results):
+                if isinstance(result, Exception):
+                    logger.warning("Failed to refresh session for %s: %s", account.username, result)
+
+    async def _async_wait_for_code(self, shared_secret: str) -> str:
+        if self._time_offset is None:
+            # the first query is blocking, so keep it off the event loop
+            await asyncio.get_running_loop().run_in_executor(None, lambda: self.time_offset)
+        timestamp, delay = self.reserve_window(shared_secret)
+        if delay:
+            logger.debug("Waiting %.1fs for the next Steam Guard code window.", delay)
+            await asyncio.sleep(delay)
+        return generate_one_time_code(shared_secret, timestamp)
+
+    @staticmethod
+    def _query_time_offset() -> float:
+        try:
+            resp = requests.post(f"{SteamURL.API}/ITwoFactorService/QueryTime/v0001", timeout=15).json()
+            offset = int(resp["response"]["server_time"]) - time.time()
+        except (requests.exceptions.RequestException, ValueError, KeyError):
+            logger.warning("Failed to query steam's time. Falling back to the local clock.")
+            return 0
+        logger.debug("Steam time offset: %.1fs", offset)
+        return offset
@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+
+import requests
+
+from .datatypes import TradeOfferState
+from .exceptions import SteamInventoryManagerError
+
+if TYPE_CHECKING:
+    from typing import Callable
+    from .account import Account
+    from .datatypes import Item
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class TrackedOffer:
+    trade_id: int
+    partner: Account
+    items: list[Item]
+    state: TradeOfferState = TradeOfferState.ACTIVE
+    # (unix time, state) for every state the offer has been seen in
+    history: list[tuple[float, TradeOfferState]] = field(default_factory=list)
+
+
+class TradeOfferTracker:
+    """
+    Tracks the state of sent trade offers.
+
+    Offers are polled in bulk: each poll makes one (paginated) listing request per sending account, regardless of how
+    many offers are outstanding. Items from offers that end without being accepted are re-queued.
+    """
+
+    def __init__(self) -> None:
+        # sending account -> trade id -> offer
+        self._outstanding: dict[Account, dict[int, TrackedOffer]] = {}
+        # sending account -> unix time of its last successful poll
+        self._last_polled: dict[Account, int] = {}
+        self._requeued: list[Item] = []
+        self._lock = threading.Lock()
+        self.finished: Counter[TradeOfferState] = Counter()
+
+    @property
+    def outstanding(self) -> int:
+        return sum(len(offers) for offers in self._outstanding.values())
+
+    def track(self, sender: Account, trade_id: int, partner: Account, items: list[Item]) -> None:
+        offer = TrackedOffer(trade_id=trade_id, partner=partner, items=items)
+        offer.history.append((time.time(), offer.state))
+        with self._lock:
+            self._outstanding.setdefault(sender, {})[trade_id] = offer
+            self._last_polled.setdefault(sender, int(time.time()))
+
+    def pop_requeued(self) -> list[Item]:
+        """Returns (and forgets) the items from offers that failed or expired."""
+        with self._lock:
+            requeued, self._requeued = self._requeued, []
+        return requeued
+
+    def poll(self) -> None:
+        for sender in list(self._outstanding):
+            self._poll_account(sender)
+
+    def run(
+        self,
+        interval: float = 60,
+        stop: threading.Event | None = None,
+        on_requeued: Callable[[list[Item]], None] | None = None,
+        on_tick: Callable[[], None] | None = None,
+    ) -> None:
+        """
+        Polls every `interval` seconds until `stop` is set or no offers are outstanding.
+        With `on_requeued`, the items of offers that failed or expired are handed to it after each poll
+        (ex. to trade them again, which tracks the new offers) instead of being kept for `pop_requeued`.
+        `on_tick` is called before each poll. (ex. to reload the config)
+        """
+        stop = stop or threading.Event()
+        while not stop.wait(interval):
+            if on_tick:
+                on_tick()
+            try:
+                self.poll()
+            except (SteamInventoryManagerError, requests.exceptions.RequestException) as e:
+                logger.warning("Failed to poll trade offers: %s", e)
+            if on_requeued:
+                requeued = self.pop_requeued()
+                if requeued:
+                    on_requeued(requeued)
+            if not self.outstanding:
+                return
+
+    def _poll_account(self, sender: Account) -> None:
+        offers = self._outstanding.get(sender)
+        if not offers:
+            return
+        polled_at = int(time.time())
+        # only offers that are still active or changed since the last poll are listed,
+        # anything missing hasn't changed. a small overlap covers clock differences.
+        cutoff = self._last_polled[sender] - 60
+        listing = sender.trade_offers(time_historical_cutoff=cutoff)
+
+        with self._lock:
+            for raw_offer in listing:
+                offer = offers.get(int(raw_offer["tradeofferid"]))
+                if not offer:
+                    continue
+                self._update(sender, offer, TradeOfferState(raw_offer["trade_offer_state"]))
+            self._last_polled[sender] = polled_at
+
+    def _update(self, sender: Account, offer: TrackedOffer, state: TradeOfferState) -> None:
+        if state == offer.state:
+            return
+        logger.info(
+            "Trade offer %d with %s: %s -> %s", offer.trade_id, offer.partner.username, offer.state.name, state.name
+        )
+        offer.state = state
+        offer.history.append((time.time(), state))
+        if not state.is_final:
+            return
+        del self._outstanding[sender][offer.trade_id]
+        self.finished[state] += 1
+        if state.failed:
+            self._requeued.extend(offer.items)
@@ -1,27 +1,64 @@
 from __future__ import annotations
 
 import base64
+import datetime
 import hmac
+import json
 import secrets
 import struct
 import time
 from hashlib import sha1
+from typing import TYPE_CHECKING
 
-from .datatypes import ItemType
+import requests
+import rsa
+from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .datatypes import ItemExterior, Item, ItemType, TradeConfirmation
+from .exceptions import (
+    IncorrectPassword,
+    LoginError,
+    CaptchaRequired,
+    EmailCodeRequired,
+    TwoFactorCodeInvalid,
+    TradeError,
+    CredentialsError,
+)
+
+if TYPE_CHECKING:
+    from typing import Any
+    from .datatypes import Decision
+    from .decisions import DecisionCache
 
 
 # contains snippets from
 # https://github.com/Gobot1234/steam.py/blob/4af51e42c5357c90bfc476a098b900541ded1a3c/steam/guard.py
 
 
-def parse_priorities(priorities: list[str] | None) -> list[ItemType]:
-    item_types: list[ItemType] = []
-    if not priorities:
-        return item_types
-    for priority in priorities:
-        caps = priority.title() if priority != "SMG" else priority
-        item_types.append(ItemType(caps))
-    return item_types
+def create_session() -> requests.Session:
+    """Creates a session that backs off and retries when steam rate limits it."""
+    session = requests.Session()
+    session.headers["User-Agent"] = "python steam-inventory-manager/v1.0.0"
+    # a 429 means the request wasn't processed, so retrying it is safe for any method. so is a failed connection.
+    # nothing else is retried: after a read error steam may have already handled a trade, and sending it again would
+    # duplicate it. once retries run out, the 429 response itself is returned.
+    retry = Retry(
+        total=None,
+        connect=3,
+        read=0,
+        other=0,
+        status=3,
+        status_forcelist=(429,),
+        allowed_methods=None,
+        backoff_factor=1,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
 
 
 def generate_session_id() -> str:
@@ -34,9 +71,9 @@ def do_no_cache():
     return int(time.time() * 1000) - (18 * 60 * 60)
 
 
-def generate_one_time_code(shared_secret: str) -> str:
+def generate_one_time_code(shared_secret: str, timestamp: int | None = None) -> str:
     """Generate a Steam Guard code for signing in."""
-    timestamp = int(time.time())
+    timestamp: int = timestamp or int(time.time())
     time_buffer = struct.pack(">Q", timestamp // 30)  # pack as Big endian, uint64
     time_hmac = hmac.new(base64.b64decode(shared_secret), time_buffer, digestmod=sha1).digest()
     begin = ord(time_hmac[19:20]) & 0xF
@@ -70,3 +107,173 @@ def generate_confirmation_code(identity_secret: str, tag: str, timestamp: int |
     timestamp: int = timestamp or int(time.time())
     buffer = struct.pack(">Q", timestamp) + tag.encode("ascii")
     return base64.b64encode(hmac.new(base64.b64decode(identity_secret), buffer, digestmod=sha1).digest()).decode()
+
+
+def generate_confirmation_params(steam_id64: int, identity_secret: str, tag: str) -> dict[str, Any]:
+    """Generate the query parameters used by the mobile confirmation endpoints."""
+    timestamp = int(time.time())
+    return {
+        "p": generate_device_id(steam_id64),
+        "a": steam_id64,
+        "k": generate_confirmation_code(identity_secret, tag, timestamp),
+        "t": timestamp,
+        "m": "android",
+        "tag": tag,
+    }
+
+
+# response parsing shared by the sync and async clients
+
+
+def parse_rsa_key(resp: dict) -> tuple[rsa.PublicKey, datetime.datetime]:
+    try:
+        mod = int(resp["publickey_mod"], 16)
+        exp = int(resp["publickey_exp"], 16)
+        timestamp = resp["timestamp"]
+    except KeyError:
+        raise LoginError("Unable to retrieve RSA keys from steam.")
+    return rsa.PublicKey(mod, exp), timestamp
+
+
+def encrypt_password(password: str, public_key: rsa.PublicKey) -> str:
+    return base64.b64encode(rsa.encrypt(password.encode("utf8"), public_key)).decode("utf8")
+
+
+def raise_for_login(attempt: dict) -> None:
+    """Raises the matching `LoginError` for a failed dologin response."""
+    email_required = attempt.get("emailauth_needed", False)
+    captcha_required = attempt.get("captcha_needed", False)
+    two_factor_required = attempt.get("requires_twofactor", False)
+    password_incorrect = attempt.get("clear_password_field", False)
+    message = attempt["message"]
+
+    if captcha_required:
+        raise CaptchaRequired(message)
+    elif password_incorrect:
+        raise IncorrectPassword(message)
+    elif two_factor_required:
+        raise TwoFactorCodeInvalid(message)
+    elif email_required:
+        raise EmailCodeRequired("Email Authentication not supported.")
+    # sometimes the error message will match
+    # 'There have been too many login failures from your network in a short time period.'
+    # 'Please wait and try again later.'
+    raise LoginError(message)
+
+
+def parse_api_key(apikey_page: str) -> str | None:
+    soup = BeautifulSoup(apikey_page, "html.parser")
+    for paragraph in soup.select("#bodyContents_ex p"):
+        if paragraph.text.startswith("Key: "):
+            return paragraph.text.split("Key: ")[-1].strip()
+    return None
+
+
+def parse_trade_token(privacy_page: str) -> str:
+    soup = BeautifulSoup(privacy_page, "html.parser")
+    trade_link = soup.find("input", {"id": "trade_offer_access_url"}).attrs["value"]
+    return trade_link.split("&token=")[-1]
+
+
+def trade_offer_payload(
+    session_id: str, partner_steam_id64: int, partner_trade_token: str, me: list | None, them: list | None
+) -> dict[str, Any]:
+    return {
+        "sessionid": session_id,
+        "serverid": 1,
+        "partner": partner_steam_id64,
+        "tradeoffermessage": f"Trade created by steam-inventory-manager on {datetime.datetime.now():%x at %X}",
+        "json_tradeoffer": json.dumps(
+            {
+                "newversion": "true",
+                "version": 2,
+                "me": {"assets": me or [], "currency": [], "ready": "false"},
+                "them": {"assets": them or [], "currency": [], "ready": "false"},
+            }
+        ),
+        "captcha": "",
+        "trade_offer_create_params": json.dumps({"trade_offer_access_token": partner_trade_token}),
+    }
+
+
+def parse_confirmations(resp: str) -> dict[int, TradeConfirmation]:
+    """Parses the mobileconf page into confirmations keyed by trade id."""
+    if "incorrect Steam Guard codes." in resp:
+        raise CredentialsError("identity_secret is incorrect")
+    if "Oh nooooooes!" in resp:
+        raise TradeError("Failed to accept trade.")
+
+    confirmations: dict[int, TradeConfirmation] = {}
+    soup = BeautifulSoup(resp, "html.parser")
+    if soup.select("#mobileconf_empty"):
+        return confirmations
+    for confirmation in soup.select("#mobileconf_list .mobileconf_list_entry"):
+        data_conf_id: int = int(confirmation["data-confid"])
+        data_key: str = confirmation["data-key"]
+        trade_id = int(confirmation["data-creator"])
+        confirmation_id: str = confirmation["id"].split("conf")[1]
+        confirmations[trade_id] = TradeConfirmation(confirmation_id, data_conf_id, data_key, trade_id)
+    return confirmations
+
+
+def parse_inventory(resp: dict, decisions: DecisionCache | None = None) -> list[Item]:
+    """
+    Parses an inventory response into its tradable items.
+    With `decisions`, each description is only parsed once, no matter how many assets share it.
+    """
+    assets: list[dict] = resp.get("assets", [])
+    descriptions: dict[tuple[str, str], dict] = {
+        (x["classid"], x.get("instanceid", "0")): x for x in resp.get("descriptions", [])
+    }
+
+    items: list[Item] = []
+
+    for asset in assets:
+        # ex. {'appid': 730, 'contextid': '2', 'assetid': '23603986921', 'classid': '4593998508', 'instanceid':
+        # '519977179', 'amount': '1'}
+        description = descriptions.get((asset["classid"], asset.get("instanceid", "0")))
+        # this means that the item isn't currently tradable.
+        # sometimes the item will never be tradable and other times it will be tradable after 7 days.
+        if description is None or description["tradable"] == 0:
+            continue
+        decision = decisions.resolve(description) if decisions else None
+        items.append(parse_item(asset, description, decision))
+    return items
+
+
+def parse_description(description: dict) -> tuple[str, ItemExterior | None, ItemType | None]:
+    """Parses the name, exterior, and type of an item description."""
+    type_values = {x.value for x in ItemType}
+    # there may be better ways to parse this.
+    exterior_value: list[str] = [
+        x["value"] for x in description.get("descriptions", []) if x["value"].startswith("Exterior: ")
+    ]
+    type_value: list[str] = [x["localized_tag_name"] for x in description.get("tags", []) if x["category"] == "Type"]
+
+    raw_exterior: str = exterior_value[0].split("Exterior: ")[-1] if exterior_value else None
+    raw_type: str = type_value[0] if type_value and type_value[0] in type_values else None
+
+    item_exterior = ItemExterior(raw_exterior) if raw_exterior else None
+    item_type = ItemType(raw_type) if raw_type else None
+    return description["name"], item_exterior, item_type
+
+
+def parse_item(asset: dict, description: dict, decision: Decision | None = None) -> Item:
+    if decision:
+        name, item_exterior, item_type = decision.name, decision.exterior, decision.type
+    else:
+        name, item_exterior, item_type = parse_description(description)
+
+    return Item(
+        name=name,
+        # right now, only csgo is supported so these are hard coded
+        appid=730,
+        contextid="2",
+        amount=int(asset["amount"]),
+        assetid=asset["assetid"],
+        # optionals
+        exterior=item_exterior,
+        type=item_type,
+        classid=asset["classid"],
+        instanceid=asset.get("instanceid", "0"),
+    )